@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import blobserk
+import blobserkfolder
+
+def time_calls(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples), min(samples)
+
+def bench_probe(path: str, repeat: int):
+    # Every call bypasses the probe cache: this measures ffprobe + parsing only.
+    cases = [
+        ("full json (-show_format -show_streams)", lambda: blobserk.ffprobe_json(path, cached=False)),
+        ("streams summary (-show_entries, json=c=1)", lambda: blobserk.probe_streams(path, cached=False)),
+        ("duration only (-show_entries format=duration)", lambda: blobserk.probe_duration(path, cached=False)),
+    ]
+    print(f"== Probe benchmark: {Path(path).name} ({repeat} calls each) ==")
+    baseline = None
+    for label, fn in cases:
+        med, best = time_calls(fn, repeat)
+        baseline = baseline or med
+        print(f"{label:<48} median {med * 1000:8.2f} ms  best {best * 1000:8.2f} ms  x{baseline / med:.2f}")
+
+# Synthetic inputs: (name, video codec, container, frame size, video bitrate). Every
+# encoder runs single-threaded with bitexact flags so the same ffmpeg build always
+# produces byte-identical files.
+CODECS = [
+    ("h264", "libx264", "mp4", "1280x720", "3M"),
+    ("h264", "libx264", "mkv", "1280x720", "3M"),
+    ("mpeg4", "mpeg4", "mkv", "640x360", "1500k"),
+    ("h264", "libx264", "ts", "640x360", "1500k"),
+]
+SIZES = {"small": 30, "medium": 120, "large": 600}   # seconds of video
+MODES = ("split_by_size_copy", "split_copy", "reencode")
+COPY_MODES = ("split_by_size_copy", "split_copy")
+# Copy-mode parts tile the input, so they may only differ from it by container overhead;
+# one duplicated 2 s GOP is already several percent of a test input.
+COPY_OVERHEAD = 0.02
+
+def make_input(workdir: Path, codec, vcodec, ext, frame, v_br, seconds) -> Path:
+    path = workdir / "inputs" / f"{codec}-{frame}-{v_br}-{seconds}s.{ext}"
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = blobserk.temp_part(path)
+    cmd = ["ffmpeg", "-y", "-v", "error",
+           "-f", "lavfi", "-i", f"testsrc2=size={frame}:rate=25:duration={seconds}",
+           "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+           "-c:v", vcodec, "-b:v", v_br, "-g", "50", "-threads", "1",
+           "-c:a", "aac", "-b:a", "96k",
+           "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact", "-map_metadata", "-1",
+           "-f", {"mkv": "matroska", "ts": "mpegts"}.get(ext, ext), str(tmp)]
+    p = blobserk.run_cmd(cmd)
+    if p.returncode != 0:
+        blobserk.discard(tmp)
+        raise blobserk.cmd_error(f"could not generate {path.name}", p)
+    return blobserk.finalize_part(tmp, path)
+
+class ProcessCounter:
+    def __init__(self):
+        self.runs = 0
+        self.seconds = 0.0
+
+    def __call__(self, cmd, returncode, seconds):
+        self.runs += 1
+        self.seconds += seconds
+
+def run_mode(mode, infile: Path, limit: int, outdir: Path):
+    prefix = infile.stem
+    if mode == "split_by_size_copy":
+        blobserk.split_by_size_copy(infile, limit, outdir, prefix)
+    elif mode == "split_copy":
+        if not blobserkfolder.split_copy(infile, limit, outdir, prefix):
+            raise RuntimeError("split_copy failed")
+    else:
+        duration = blobserk.probe_duration(str(infile), cached=False)
+        blobserk.split_reencode(infile, duration, limit, 1_000_000, 96_000, outdir, prefix)
+    return blobserk.collect_parts(outdir, prefix, infile.suffix, 10_000)
+
+def measure(mode, infile: Path, parts_wanted: int, outdir: Path, counter: ProcessCounter):
+    """One run into an empty output folder with no probe cache open, so every run pays
+    for its own probes. Disk I/O is the reaped children's rusage, i.e. only what missed
+    the page cache; bytes_out is what the parts add up to."""
+    in_size = infile.stat().st_size
+    limit = math.ceil(in_size / parts_wanted * 1.05)
+    shutil.rmtree(outdir, ignore_errors=True)
+    counter.runs, counter.seconds = 0, 0.0
+    try:
+        import resource   # POSIX only
+    except ImportError:
+        resource = None
+    ru0 = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parts = run_mode(mode, infile, limit, outdir)
+    wall = time.perf_counter() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    sizes = [f.stat().st_size for f in parts]
+    fills = [s / limit for s in sizes[:-1]] or [s / limit for s in sizes]
+    return {
+        "wall_s": round(wall, 3),
+        "processes": counter.runs,
+        "process_s": round(counter.seconds, 3),
+        # None where rusage is unavailable (Windows)
+        "cpu_s": round((ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime), 3) if ru1 else None,
+        "disk_read_bytes": (ru1.ru_inblock - ru0.ru_inblock) * 512 if ru1 else None,
+        "disk_write_bytes": (ru1.ru_oublock - ru0.ru_oublock) * 512 if ru1 else None,
+        "bytes_in": in_size,
+        "bytes_out": sum(sizes),
+        "limit": limit,
+        "parts": len(sizes),
+        "parts_ideal": math.ceil(in_size / limit),
+        "over_limit": sum(s > limit for s in sizes),
+        # how full the parts are, the last one excluded: 1.0 means every part hit the limit
+        "fill_mean": round(statistics.fmean(fills), 4) if fills else 0.0,
+        "fill_min": round(min(fills), 4) if fills else 0.0,
+    }
+
+def ffmpeg_version():
+    p = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return p.stdout.splitlines()[0] if p.stdout else "unknown"
+
+def bench_suite(args):
+    workdir = Path(args.workdir).expanduser().resolve()
+    counter = ProcessCounter()
+    blobserk.add_cmd_hook(counter)
+    results = []
+    for size in args.sizes:
+        for codec, vcodec, ext, frame, v_br in CODECS:
+            infile = make_input(workdir, codec, vcodec, ext, frame, v_br, SIZES[size])
+            for mode in args.modes:
+                outdir = workdir / "out" / infile.stem / mode
+                runs = [measure(mode, infile, args.parts, outdir, counter) for _ in range(args.repeat)]
+                best = min(runs, key=lambda r: r["wall_s"])
+                best["wall_median_s"] = round(statistics.median(r["wall_s"] for r in runs), 3)
+                results.append({"case": infile.name, "size": size, "mode": mode, **best})
+                shutil.rmtree(outdir, ignore_errors=True)
+                print_row(results[-1])
+                if codec == "h264" and mode in COPY_MODES and best["bytes_out"] > best["bytes_in"] * (1 + COPY_OVERHEAD):
+                    raise RuntimeError(f"{infile.name} {mode}: parts overlap, {best['bytes_out']} bytes written"
+                                       f" for {best['bytes_in']} bytes input")
+    return results
+
+def print_row(r):
+    print(f"{r['case']:<34} {r['mode']:<19} {r['wall_median_s']:8.2f}s  procs {r['processes']:4d}  "
+          f"out {blobserk.bytes_to_human(r['bytes_out']):>10} / in {blobserk.bytes_to_human(r['bytes_in']):>10}  "
+          f"parts {r['parts']}/{r['parts_ideal']}  fill {r['fill_mean']:.3f} (min {r['fill_min']:.3f})  over {r['over_limit']}")
+
+def compare(results, baseline_path: Path):
+    base = {(r["case"], r["mode"]): r for r in json.loads(baseline_path.read_text(encoding="utf-8"))["results"]}
+    print(f"== Against {baseline_path.name} ==")
+    for r in results:
+        old = base.get((r["case"], r["mode"]))
+        if not old:
+            continue
+        print(f"{r['case']:<34} {r['mode']:<19} wall x{r['wall_median_s'] / max(old['wall_median_s'], 1e-6):.2f}  "
+              f"procs {old['processes']} -> {r['processes']}  parts {old['parts']} -> {r['parts']}  "
+              f"fill {old['fill_mean']:.3f} -> {r['fill_mean']:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for blobserk.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_probe = sub.add_parser("probe", help="per-call cost of full vs minimal-field ffprobe queries")
+    p_probe.add_argument("input")
+    p_probe.add_argument("--repeat", type=int, default=20)
+    p_suite = sub.add_parser("suite", help="split synthetic testsrc/sine videos with every writer")
+    p_suite.add_argument("--workdir", default="bench_work", help="generated inputs (kept and reused) and scratch output")
+    p_suite.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    p_suite.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    p_suite.add_argument("--parts", type=int, default=4, help="size limit = input size / N (+5%%)")
+    p_suite.add_argument("--repeat", type=int, default=3)
+    p_suite.add_argument("--label", default=None, help="name stored with the results, e.g. a version or commit")
+    p_suite.add_argument("--save", default=None, metavar="FILE", help="write results as JSON")
+    p_suite.add_argument("--compare", default=None, metavar="FILE", help="print ratios against results saved earlier")
+    args = parser.parse_args()
+    blobserk.require_bin("ffprobe")
+    if args.cmd == "probe":
+        if not Path(args.input).exists():
+            sys.exit(1)
+        bench_probe(args.input, args.repeat)
+    elif args.cmd == "suite":
+        blobserk.require_bin("ffmpeg")
+        try:
+            results = bench_suite(args)
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            sys.exit(4)
+        if args.save:
+            doc = {"label": args.label, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "ffmpeg": ffmpeg_version(),
+                   "python": platform.python_version(), "platform": platform.platform(), "results": results}
+            Path(args.save).write_text(json.dumps(doc, indent=2) + "\n", encoding="utf-8")
+            print(f"Saved: {args.save}")
+        if args.compare:
+            compare(results, Path(args.compare))
+
+if __name__ == "__main__":
+    main()
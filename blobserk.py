@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
 import json
 import math
 import os
 import re
 import shutil
+import sqlite3
+import struct
 import subprocess
 import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 def require_bin(name: str):
@@ -14,8 +23,84 @@ def require_bin(name: str):
         print(f"ERROR: '{name}' not found in PATH.")
         sys.exit(1)
 
-def run_cmd(cmd):
-    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+# Lines of ffmpeg/ffprobe stderr kept for error reports; a long, noisy run must not
+# grow without bound.
+STDERR_TAIL_LINES = 40
+
+# fn(cmd, returncode, seconds) is called after every ffmpeg/ffprobe process exits;
+# blobserkfolder uses this for its event log and metrics.
+_cmd_hooks = []
+
+def add_cmd_hook(fn):
+    _cmd_hooks.append(fn)
+
+def _ran(cmd, returncode: int, t0: float):
+    dt = time.monotonic() - t0
+    for fn in _cmd_hooks:
+        fn(cmd, returncode, dt)
+
+def _drain_lines(stream, sink):
+    # ffmpeg redraws its stats line with \r, so split on both or a long run's stats
+    # pile up as one ever-growing "line"
+    buf = b""
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        *lines, buf = re.split(rb"[\r\n]", buf + chunk)
+        for raw in lines:
+            if raw.strip():
+                sink(raw.decode("utf-8", "ignore").rstrip())
+    if buf.strip():
+        sink(buf.decode("utf-8", "ignore").rstrip())
+    stream.close()
+
+def run_cmd(cmd, on_progress=None):
+    """Run cmd without buffering its stderr: lines are streamed into a ring buffer of the
+    last STDERR_TAIL_LINES, returned as .stderr. Without on_progress stdout is collected
+    as usual; with it (see with_progress) stdout is parsed as it arrives and every
+    completed key=value block is handed to on_progress, the last one is .progress."""
+    t0 = time.monotonic()
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    reader = threading.Thread(target=_drain_lines, args=(p.stderr, tail.append), daemon=True)
+    reader.start()
+    stats = {}
+    if on_progress is None:
+        out = p.stdout.read()
+    else:
+        out = b""
+        block = {}
+        for raw in iter(p.stdout.readline, b""):
+            key, sep, value = raw.decode("utf-8", "ignore").partition("=")
+            if not sep:
+                continue
+            block[key.strip()] = value.strip()
+            if key.strip() == "progress":
+                stats = block
+                on_progress(stats)
+                block = {}
+    p.stdout.close()
+    rc = p.wait()
+    reader.join()
+    _ran(cmd, rc, t0)
+    done = subprocess.CompletedProcess(cmd, rc, out, "\n".join(tail))
+    done.progress = stats
+    return done
+
+def cmd_error(message: str, p) -> RuntimeError:
+    tail = p.stderr.strip().splitlines()[-5:] if p.stderr else []
+    return RuntimeError("\n  ".join([message] + tail))
+
+def with_progress(cmd):
+    # ffmpeg reports key=value progress blocks on stdout; the last out_time_us is the
+    # timestamp of the last packet written, i.e. the part's length.
+    return [cmd[0], "-nostats", "-progress", "pipe:1"] + list(cmd[1:])
+
+def progress_out_seconds(stats: dict) -> float:
+    for key in ("out_time_us", "out_time_ms"):
+        try:
+            return int(stats[key]) / 1_000_000
+        except (KeyError, ValueError):
+            pass
+    return 0.0
 
 def human_to_bytes(s: str) -> int:
     s = s.strip().lower().replace(" ", "")
@@ -35,15 +120,105 @@ def bytes_to_human(n: int) -> str:
             return f"{n:.2f} {unit}"
         n /= 1024
 
-def ffprobe_json(path: str) -> dict:
+class ProbeCache:
+    """On-disk store of probe results keyed by (resolved path, size, mtime_ns); an entry
+    is ignored as soon as the file is modified."""
+    FILENAME = ".blobserk-cache.sqlite"
+
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS probe (path TEXT, kind TEXT, size INTEGER, mtime_ns INTEGER,"
+            " data BLOB, PRIMARY KEY (path, kind))"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def _key(path: str):
+        st = os.stat(path)
+        return str(Path(path).resolve()), st.st_size, st.st_mtime_ns
+
+    def get(self, path: str, kind: str):
+        try:
+            key, size, mtime_ns = self._key(path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime_ns, data FROM probe WHERE path = ? AND kind = ?", (key, kind)
+            ).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None
+        return row[2]
+
+    def put(self, path: str, kind: str, data):
+        try:
+            key, size, mtime_ns = self._key(path)
+        except OSError:
+            return
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO probe (path, kind, size, mtime_ns, data) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, size, mtime_ns, data),
+            )
+            self.db.commit()
+
+_probe_cache = None
+
+def open_probe_cache(root: Path):
+    global _probe_cache
+    _probe_cache = ProbeCache(root / ProbeCache.FILENAME)
+    return _probe_cache
+
+def ffprobe_json(path: str, cached: bool = True) -> dict:
+    cache = _probe_cache if cached else None
+    if cache is not None:
+        hit = cache.get(path, "format_streams")
+        if hit is not None:
+            return json.loads(hit)
     cmd = ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
     p = run_cmd(cmd)
     if p.returncode != 0:
-        raise RuntimeError("ffprobe failed")
-    return json.loads(p.stdout.decode("utf-8", "ignore"))
+        raise cmd_error("ffprobe failed", p)
+    text = p.stdout.decode("utf-8", "ignore")
+    meta = json.loads(text)
+    if cache is not None:
+        cache.put(path, "format_streams", text)
+    return meta
+
+def ffprobe_entries(path: str, kind: str, args, cached: bool = True) -> str:
+    """Run ffprobe restricted to the given -show_entries/-of arguments and return its raw
+    output; much cheaper to produce and parse than a full ffprobe_json dump."""
+    cache = _probe_cache if cached else None
+    if cache is not None:
+        hit = cache.get(path, kind)
+        if hit is not None:
+            return hit
+    p = run_cmd(["ffprobe", "-v", "error", *args, path])
+    if p.returncode != 0:
+        raise cmd_error("ffprobe failed", p)
+    text = p.stdout.decode("utf-8", "ignore")
+    if cache is not None:
+        cache.put(path, kind, text)
+    return text
+
+def probe_duration(path: str, cached: bool = True) -> float:
+    try:
+        text = ffprobe_entries(path, "duration", ["-show_entries", "format=duration", "-of", "default=nw=1:nk=1"], cached)
+        return float(text.split()[0])
+    except (RuntimeError, ValueError, IndexError):
+        return 0.0
+
+def probe_streams(path: str, cached: bool = True) -> dict:
+    # Only what get_media_info and reference_stream_index read.
+    entries = "format=duration,bit_rate:stream=index,codec_type,bit_rate:stream_disposition=attached_pic"
+    text = ffprobe_entries(path, "streams", ["-show_entries", entries, "-of", "json=c=1"], cached)
+    return json.loads(text)
 
 def get_media_info(path: str):
-    meta = ffprobe_json(path)
+    meta = probe_streams(path)
     fmt = meta.get("format", {})
     duration = float(fmt.get("duration", 0.0)) if fmt.get("duration") else 0.0
     total_bitrate = 0
@@ -63,36 +238,572 @@ def estimate_size_bytes(duration_s: float, bitrate_bps: int) -> int:
         return 0
     return int(duration_s * bitrate_bps / 8)
 
-def ffprobe_duration(path: str) -> float:
+class PacketIndex:
+    """Keyframes of the reference stream, each with its dts and the cumulative bytes of
+    all packets (every stream) demuxed before it. Times count from the first timestamp
+    in the file, as ffmpeg's -ss, -t and segment times do."""
+    VERSION = 2   # part of the probe cache kind: older entries have no dts
+
+    def __init__(self):
+        self.kf_times = array("d")
+        self.kf_dts = array("d")
+        self.kf_bytes = array("q")
+        self.total_bytes = 0
+        self.duration = 0.0
+
+    def add_keyframe(self, t: float, dts: float, cum_bytes: int):
+        if self.kf_times and t <= self.kf_times[-1]:
+            return
+        self.kf_times.append(t)
+        self.kf_dts.append(dts)
+        self.kf_bytes.append(cum_bytes)
+
+    def to_bytes(self) -> bytes:
+        head = struct.pack("<qdq", self.total_bytes, self.duration, len(self.kf_times))
+        return head + self.kf_times.tobytes() + self.kf_dts.tobytes() + self.kf_bytes.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PacketIndex":
+        idx = cls()
+        idx.total_bytes, idx.duration, n = struct.unpack_from("<qdq", data)
+        off = struct.calcsize("<qdq")
+        idx.kf_times.frombytes(data[off:off + 8 * n])
+        idx.kf_dts.frombytes(data[off + 8 * n:off + 16 * n])
+        idx.kf_bytes.frombytes(data[off + 16 * n:off + 24 * n])
+        return idx
+
+def reference_stream_index(meta: dict) -> int:
+    for s in meta.get("streams", []):
+        if s.get("codec_type") == "video" and not s.get("disposition", {}).get("attached_pic"):
+            return int(s["index"])
+    return 0
+
+def build_packet_index(path: str, ref_stream: int) -> PacketIndex:
+    # Streamed line by line: a multi-hour file has millions of packets and only the
+    # keyframes are kept.
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "packet=stream_index,pts_time,dts_time,size,flags",
+           "-of", "csv=p=0", path]
+    t0 = time.monotonic()
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    idx = PacketIndex()
+    cum = 0
+    first = last = None
+    for line in p.stdout:
+        fields = line.strip().split(",")
+        if len(fields) < 5:
+            continue
+        try:
+            size = int(fields[3])
+        except ValueError:
+            continue
+        try:
+            t = float(fields[1])
+        except ValueError:
+            t = None
+        if t is not None:
+            first = t if first is None else min(first, t)
+            last = t if last is None else max(last, t)
+            if fields[0] == str(ref_stream) and "K" in fields[4]:
+                try:
+                    dts = float(fields[2])
+                except ValueError:
+                    dts = t
+                idx.add_keyframe(t, dts, cum)
+        cum += size
+    _ran(cmd, p.wait(), t0)
+    if p.returncode != 0:
+        raise RuntimeError("ffprobe packet scan failed")
+    if first:
+        for arr in (idx.kf_times, idx.kf_dts):
+            for i in range(len(arr)):
+                arr[i] -= first
+    idx.duration = last - first if last is not None else 0.0
+    idx.total_bytes = cum
+    return idx
+
+# stop is the dts of the keyframe at end: with -c copy, -t cuts on dts, and on B-frame
+# sources a keyframe's dts lies before its pts. None in plans journaled before it existed.
+PlannedPart = namedtuple("PlannedPart", "start end size stop", defaults=(None,))
+
+def greedy_cut_indices(offs, total: int, budget: int):
+    cuts = []
+    k = 0
+    start_b = 0
+    while total - start_b > budget and k + 1 < len(offs):
+        j = bisect_right(offs, start_b + budget) - 1
+        if j <= k:
+            j = k + 1
+        cuts.append(j)
+        k, start_b = j, offs[j]
+    return cuts
+
+def balanced_cut_indices(offs, total: int, budget: int):
+    # Same number of parts as greedy, with the largest part as small as keyframes allow:
+    # binary search for the smallest cap under which greedy still needs no more cuts.
+    cuts = greedy_cut_indices(offs, total, budget)
+    lo, hi = max(1, math.ceil(total / (len(cuts) + 1))), budget
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if len(greedy_cut_indices(offs, total, mid)) <= len(cuts):
+            hi = mid
+        else:
+            lo = mid + 1
+    return greedy_cut_indices(offs, total, hi)
+
+def plan_cuts(index: PacketIndex, size_limit_bytes: int, duration_s: float, margin: float = 0.01,
+              balance: bool = False, file_size: int = 0):
+    """Keyframe-aligned plan under the limit minus a small allowance for container
+    overhead: greedy fills each part with as many whole GOPs as fit, balance spreads
+    the same bytes as evenly as keyframes allow over greedy's number of parts.
+    file_size is the input's size on disk; packet sizes leave out the container, so
+    the budget shrinks by the input's own overhead ratio (MPEG-TS spends over 2% on
+    packet headers alone)."""
+    budget = int(size_limit_bytes * (1 - margin))
+    if file_size > index.total_bytes > 0:
+        budget = int(budget * index.total_bytes / file_size)
+    times, dts, offs = index.kf_times, index.kf_dts, index.kf_bytes
+    if not times:
+        # without a single cut point the whole file would become one oversized part
+        raise RuntimeError("no keyframes in packet index")
+    if balance:
+        cuts = balanced_cut_indices(offs, index.total_bytes, budget)
+    else:
+        cuts = greedy_cut_indices(offs, index.total_bytes, budget)
+    end_time = max(duration_s, index.duration)
+    parts = []
+    start_t, start_b = 0.0, 0
+    for j in cuts:
+        parts.append(PlannedPart(start_t, times[j], offs[j] - start_b, dts[j]))
+        start_t, start_b = times[j], offs[j]
+    parts.append(PlannedPart(start_t, end_time, index.total_bytes - start_b))
+    return parts
+
+def load_packet_index(path: str) -> PacketIndex:
+    ref_stream = reference_stream_index(probe_streams(path))
+    kind = f"packets{PacketIndex.VERSION}:{ref_stream}"
+    if _probe_cache is not None:
+        hit = _probe_cache.get(path, kind)
+        if hit is not None:
+            return PacketIndex.from_bytes(hit)
+    index = build_packet_index(path, ref_stream)
+    if _probe_cache is not None:
+        _probe_cache.put(path, kind, index.to_bytes())
+    return index
+
+def plan_copy(path: str, size_limit_bytes: int, duration_s: float, balance: bool = False):
+    return plan_cuts(load_packet_index(path), size_limit_bytes, duration_s, balance=balance,
+                     file_size=os.path.getsize(path))
+
+# Planned cuts sit exactly on keyframe pts, but ffprobe prints pts_time rounded to the
+# microsecond. Nudging by well under one frame keeps each cut on its own keyframe
+# instead of the previous (seek) or next (segment muxer) one.
+CUT_EPSILON = 0.001
+
+def part_path(outdir: Path, prefix: str, idx: int, suffix: str) -> Path:
+    return outdir / f"{prefix}_part{idx:02d}{suffix}"
+
+def temp_prefix(prefix: str) -> str:
+    return f".{prefix}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+def temp_part(final: Path) -> Path:
+    # Same directory, so same filesystem: os.replace onto the final name is atomic and a
+    # killed run never leaves a truncated file under a real part name.
+    return final.with_name(temp_prefix(final.stem) + final.suffix)
+
+def discard(tmp: Path):
     try:
-        meta = ffprobe_json(path)
-        fmt = meta.get("format", {})
-        return float(fmt.get("duration", 0.0)) if fmt.get("duration") else 0.0
-    except:
-        return 0.0
+        tmp.unlink()
+    except OSError:
+        pass
+
+def finalize_part(tmp: Path, final: Path) -> Path:
+    if not tmp.exists() or tmp.stat().st_size == 0:
+        discard(tmp)
+        raise RuntimeError(f"no output written for {final.name}")
+    os.replace(tmp, final)
+    return final
+
+def temp_segments(outdir: Path, tmp_prefix: str, suffix: str):
+    # every segment the muxer wrote, in order, however many that turned out to be
+    rx = re.compile(re.escape(f"{tmp_prefix}_part") + r"(\d+)" + re.escape(suffix) + "$")
+    found = []
+    for f in outdir.iterdir():
+        m = rx.match(f.name)
+        if m:
+            found.append((int(m.group(1)), f))
+    return [f for _, f in sorted(found)]
+
+def finalize_segments(outdir: Path, tmp_prefix: str, prefix: str, suffix: str):
+    segments = temp_segments(outdir, tmp_prefix, suffix)
+    parts = []
+    try:
+        for i, f in enumerate(segments, 1):
+            parts.append(finalize_part(f, part_path(outdir, prefix, i, suffix)))
+    except RuntimeError:
+        for f in segments[len(parts):]:
+            discard(f)
+        raise
+    return parts
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        return True   # os.kill would terminate it; leave old temps to the age check
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def sweep_temps(outdir: Path, prefix: str, max_age: float = 86400.0):
+    """Remove temp parts and segments of prefix left behind by a killed run: those of a
+    process that no longer exists or, where that cannot be checked, untouched for
+    max_age seconds. Temps of this process and of other live runs are kept."""
+    rx = re.compile(r"\." + re.escape(prefix) + r"(?:_part\d+)?\.(\d+)-\d+\.tmp")
+    try:
+        entries = list(os.scandir(outdir))
+    except OSError:
+        return
+    for e in entries:
+        m = rx.match(e.name)
+        if not m or not e.is_file(follow_symlinks=False):
+            continue
+        try:
+            stale = not _pid_alive(int(m.group(1))) or time.time() - e.stat().st_mtime > max_age
+        except OSError:
+            continue
+        if stale:
+            discard(Path(e.path))
 
-def split_by_size_copy(infile: Path, size_limit_bytes: int, outdir: Path, prefix: str):
+def segment_pattern(outdir: Path, prefix: str, suffix: str) -> str:
+    # the segment muxer expands printf-style %d, so a literal % in a name must be doubled
+    return f"{outdir}{os.sep}{prefix}_part".replace("%", "%%") + f"%02d{suffix.replace('%', '%%')}"
+
+def build_segment_cmd(infile: Path, cut_times, outdir: Path, prefix: str):
+    # One ffmpeg process, one demux pass: the segment muxer starts a new part at the
+    # first keyframe at or after each cut time.
+    pattern = segment_pattern(outdir, prefix, infile.suffix)
+    cmd = ["ffmpeg", "-y", "-i", str(infile), "-c", "copy", "-f", "segment",
+           "-segment_start_number", "1", "-reset_timestamps", "1"]
+    if cut_times:
+        cmd += ["-segment_times", ",".join(f"{max(0.0, t - CUT_EPSILON):.6f}" for t in cut_times)]
+    else:
+        cmd += ["-segment_time", "1000000000"]
+    cmd.append(pattern)
+    return cmd
+
+def collect_parts(outdir: Path, prefix: str, suffix: str, max_parts: int):
+    parts = []
+    for idx in range(1, max_parts + 1):
+        f = part_path(outdir, prefix, idx, suffix)
+        if not f.exists():
+            break
+        parts.append(f)
+    return parts
+
+def split_segments_copy(infile: Path, plan, size_limit_bytes: int, outdir: Path, prefix: str):
     outdir.mkdir(parents=True, exist_ok=True)
-    duration, _ = get_media_info(str(infile))
-    if duration <= 0:
-        sys.exit(2)
-    part_idx = 1
-    offset = 0.0
-    while True:
-        outfile = outdir / f"{prefix}_part{part_idx:02d}{infile.suffix}"
-        cmd = ["ffmpeg", "-y", "-ss", f"{offset}", "-i", str(infile), "-c", "copy", "-fs", f"{size_limit_bytes}", str(outfile)]
-        p = run_cmd(cmd)
+    sweep_temps(outdir, prefix)
+    tmp_prefix = temp_prefix(prefix)
+    p = run_cmd(build_segment_cmd(infile, [pp.start for pp in plan[1:]], outdir, tmp_prefix))
+    if p.returncode != 0:
+        for f in temp_segments(outdir, tmp_prefix, infile.suffix):
+            discard(f)
+        raise cmd_error("ffmpeg segment split failed", p)
+    parts = finalize_segments(outdir, tmp_prefix, prefix, infile.suffix)
+    over = []
+    for f in parts:
+        size = f.stat().st_size
+        if size > size_limit_bytes:
+            over.append(f"{f.name} ({bytes_to_human(size)})")
+            discard(f)
+        else:
+            print(f"Created: {f.name} ({bytes_to_human(size)})")
+    if over:
+        raise RuntimeError(f"over the size limit: {', '.join(over)}")
+    return parts
+
+def build_extract_cmd(infile: Path, pp: PlannedPart, outfile: Path, last: bool):
+    # Input -ss in copy mode starts at the keyframe at or before the seek point, so seek
+    # just past the planned keyframe and stop just before the next part's keyframe. The
+    # -t cutoff is tested against packet dts, so it is measured to that keyframe's dts.
+    seek = pp.start + CUT_EPSILON if pp.start > 0 else 0.0
+    cmd = ["ffmpeg", "-y", "-ss", f"{seek:.6f}", "-i", str(infile)]
+    if not last:
+        stop = pp.end if pp.stop is None else pp.stop
+        cmd += ["-t", f"{stop - seek - CUT_EPSILON:.6f}"]
+    cmd += ["-c", "copy", str(outfile)]
+    return cmd
+
+def extract_parts(infile: Path, plan, size_limit_bytes: int, outdir: Path, prefix: str, jobs: int):
+    # Parts of a plan do not depend on each other, so they can be written concurrently;
+    # jobs caps the number of simultaneous ffmpeg readers on the source disk.
+    outdir.mkdir(parents=True, exist_ok=True)
+    sweep_temps(outdir, prefix)
+    def extract(i):
+        outfile = part_path(outdir, prefix, i + 1, infile.suffix)
+        tmp = temp_part(outfile)
+        p = run_cmd(build_extract_cmd(infile, plan[i], tmp, i == len(plan) - 1))
         if p.returncode != 0:
-            sys.exit(3)
-        chunk_dur = ffprobe_duration(str(outfile))
-        if chunk_dur <= 0.2:
-            outfile.exists() and outfile.unlink(missing_ok=True)
+            discard(tmp)
+            raise cmd_error(f"ffmpeg failed on part {i + 1}", p)
+        if tmp.exists() and tmp.stat().st_size > size_limit_bytes:
+            size = tmp.stat().st_size
+            discard(tmp)
+            raise RuntimeError(f"part {i + 1} is over the size limit ({bytes_to_human(size)})")
+        return finalize_part(tmp, outfile)
+    parts = []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(plan)))) as ex:
+        for f in ex.map(extract, range(len(plan))):
+            print(f"Created: {f.name} ({bytes_to_human(f.stat().st_size)})")
+            parts.append(f)
+    return parts
+
+def split_by_size_copy(infile: Path, size_limit_bytes: int, outdir: Path, prefix: str,
+                       plan=None, part_jobs: int = 1, single_pass: bool = False, balance: bool = False):
+    if plan is None:
+        duration, _ = get_media_info(str(infile))
+        if duration <= 0:
+            sys.exit(2)
+        plan = plan_copy(str(infile), size_limit_bytes, duration, balance)
+    if single_pass and part_jobs <= 1:
+        parts = split_segments_copy(infile, plan, size_limit_bytes, outdir, prefix)
+    else:
+        parts = extract_parts(infile, plan, size_limit_bytes, outdir, prefix, part_jobs)
+    # Keyframe-aligned parts tile the input, so they add up to the input minus the
+    # difference in container overhead; a large excess means overlapping GOPs.
+    written = sum(f.stat().st_size for f in parts)
+    print(f"Total: {bytes_to_human(written)} written for {bytes_to_human(infile.stat().st_size)} input")
+    return parts
+
+def encode_args(v_bps: int, a_bps: int):
+    return ["-map", "0:v:0", "-map", "0:a:0?",
+            "-c:v", "libx264", "-preset", "veryfast", "-b:v", f"{v_bps}",
+            "-c:a", "aac", "-b:a", f"{a_bps}"]
+
+def split_reencode(infile: Path, duration: float, size_limit_bytes: int, v_bps: int, a_bps: int,
+                   outdir: Path, prefix: str, margin: float = 0.02, max_attempts: int = 4):
+    """Encode parts one after another. The nominal bitrate only seeds the first part's
+    length: every later length comes from the bytes per second actually measured on the
+    previous part, and a part that ends up over the limit is re-encoded shorter."""
+    outdir.mkdir(parents=True, exist_ok=True)
+    sweep_temps(outdir, prefix)
+    budget = int(size_limit_bytes * (1 - margin))
+    remaining = duration
+    start = 0.0
+    part_idx = 1
+    part_seconds = max(1.0, budget * 8 / (v_bps + a_bps))
+    while remaining > 0.2:
+        outfile = part_path(outdir, prefix, part_idx, infile.suffix)
+        tmp = temp_part(outfile)
+        for attempt in range(max_attempts):
+            cmd = ["ffmpeg", "-y", "-ss", f"{start}", "-i", str(infile), *encode_args(v_bps, a_bps),
+                   "-t", f"{part_seconds:.3f}", str(tmp)]
+            p = run_cmd(with_progress(cmd), on_progress=lambda stats: None)
+            if p.returncode != 0:
+                discard(tmp)
+                raise cmd_error(f"ffmpeg failed on part {part_idx}", p)
+            actual = progress_out_seconds(p.progress)
+            size = tmp.stat().st_size
+            if size <= size_limit_bytes or actual <= 0:
+                break
+            part_seconds = actual * budget / size
+            print(f"Over limit: {outfile.name} ({bytes_to_human(size)}), retrying with {part_seconds:.2f}s")
+        else:
+            discard(tmp)
+            raise RuntimeError(f"part {part_idx} still over the limit after {max_attempts} attempts")
+        finalize_part(tmp, outfile)
+        print(f"Created: {outfile.name} ({bytes_to_human(size)} ≈ {actual:.2f}s)")
+        if actual <= 0:
             break
-        print(f"Created: {outfile.name} ({bytes_to_human(outfile.stat().st_size)} ≈ {chunk_dur:.2f}s)")
-        offset += chunk_dur
+        part_seconds = max(1.0, budget / (size / actual))
+        start += actual
+        remaining -= actual
         part_idx += 1
-        if offset + 0.2 >= duration:
-            break
+
+def split_reencode_single(infile: Path, duration: float, size_limit_bytes: int, v_bps: int, a_bps: int,
+                          outdir: Path, prefix: str, margin: float = 0.02):
+    # Decode once, encode once: one ffmpeg feeds a single encoder into the segment muxer.
+    # Keyframes are forced on every part boundary so segments cut exactly there, and
+    # maxrate/bufsize keep each part close to its nominal share of the budget.
+    outdir.mkdir(parents=True, exist_ok=True)
+    sweep_temps(outdir, prefix)
+    budget = int(size_limit_bytes * (1 - margin))
+    part_seconds = max(1.0, budget * 8 / (v_bps + a_bps))
+    tmp_prefix = temp_prefix(prefix)
+    pattern = segment_pattern(outdir, tmp_prefix, infile.suffix)
+    cmd = ["ffmpeg", "-y", "-i", str(infile), *encode_args(v_bps, a_bps),
+           "-maxrate", f"{v_bps}", "-bufsize", f"{2 * v_bps}",
+           "-force_key_frames", f"expr:gte(t,n_forced*{part_seconds:.3f})",
+           "-f", "segment", "-segment_time", f"{part_seconds:.3f}", "-segment_start_number", "1",
+           "-reset_timestamps", "1", pattern]
+    p = run_cmd(cmd)
+    if p.returncode != 0:
+        for f in temp_segments(outdir, tmp_prefix, infile.suffix):
+            discard(f)
+        raise cmd_error("ffmpeg segment re-encode failed", p)
+    for f in finalize_segments(outdir, tmp_prefix, prefix, infile.suffix):
+        size = f.stat().st_size
+        note = "  !! over limit" if size > size_limit_bytes else ""
+        print(f"Created: {f.name} ({bytes_to_human(size)}){note}")
+
+def keyframe_ranges(kf_times, start: float, end: float, step: float):
+    """Split [start, end) into ranges of at most step seconds, moving each boundary back
+    to the nearest source keyframe so encoders seek without a long decode warm-up."""
+    bounds = [start]
+    t = start + step
+    while t + 0.2 < end:
+        j = bisect_right(kf_times, t) - 1
+        cut = kf_times[j] if j >= 0 and kf_times[j] > bounds[-1] + 0.2 else t
+        bounds.append(cut)
+        t = cut + step
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def concat_cmd(list_file: Path, outfile: Path, audio: Path = None, start: float = 0.0, end: float = 0.0):
+    # Video chunks are joined by stream copy; the audio of [start, end) is cut from one
+    # encode of the whole track, so no AAC priming/padding lands on chunk boundaries.
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_file)]
+    if audio is not None:
+        cmd += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", str(audio), "-map", "0:v:0", "-map", "1:a:0"]
+    return cmd + ["-c", "copy", str(outfile)]
+
+# Chunk length for split_reencode_chunked: a sixteenth of a part keeps the size
+# granularity fine, and the floor bounds the ffmpeg process count on long inputs.
+CHUNK_PART_FRACTION = 16
+CHUNK_MIN_SECONDS = 30.0
+
+def split_reencode_chunked(infile: Path, duration: float, size_limit_bytes: int, v_bps: int, a_bps: int,
+                           outdir: Path, prefix: str, jobs: int, margin: float = 0.02):
+    # The video is cut into keyframe-aligned chunks (at least two per worker) that are
+    # encoded concurrently without audio while one more worker encodes the whole audio
+    # track; parts are then built by stream-copy concatenation of as many consecutive
+    # chunks as their real encoded sizes plus their share of audio allow.
+    outdir.mkdir(parents=True, exist_ok=True)
+    sweep_temps(outdir, prefix)
+    kf_times = load_packet_index(str(infile)).kf_times
+    has_audio = any(st.get("codec_type") == "audio" for st in probe_streams(str(infile)).get("streams", []))
+    budget = int(size_limit_bytes * (1 - margin))
+    part_seconds = max(1.0, budget * 8 / (v_bps + a_bps))
+    chunk_seconds = max(CHUNK_MIN_SECONDS, min(part_seconds / CHUNK_PART_FRACTION, duration / (jobs * 2)))
+    chunkdir = outdir / f".{prefix}.chunks"
+    chunkdir.mkdir(exist_ok=True)
+    try:
+        chunks = [(cs, ce, chunkdir / f"c{i:05d}.mkv")
+                  for i, (cs, ce) in enumerate(keyframe_ranges(kf_times, 0.0, duration, chunk_seconds))]
+        audio = chunkdir / "audio.mka" if has_audio else None
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+        def encode(chunk):
+            cs, ce, cf = chunk
+            cmd = ["ffmpeg", "-y", "-ss", f"{cs:.6f}", "-i", str(infile), "-t", f"{ce - cs:.6f}",
+                   "-map", "0:v:0", "-c:v", "libx264", "-preset", "veryfast", "-b:v", f"{v_bps}",
+                   "-an", "-threads", str(threads), str(cf)]
+            p = run_cmd(cmd)
+            if p.returncode != 0:
+                raise cmd_error(f"ffmpeg failed on chunk {cf.name}", p)
+            return cf.stat().st_size
+        def encode_audio():
+            p = run_cmd(["ffmpeg", "-y", "-i", str(infile), "-map", "0:a:0", "-vn", "-c:a", "aac", "-b:a", f"{a_bps}", str(audio)])
+            if p.returncode != 0:
+                raise cmd_error("ffmpeg failed on the audio track", p)
+        print(f"Encoding {len(chunks)} chunk(s) on {jobs} worker(s)...")
+        with ThreadPoolExecutor(max_workers=jobs + 1) as ex:
+            audio_job = ex.submit(encode_audio) if audio else None
+            sizes = list(ex.map(encode, chunks))
+            if audio_job:
+                audio_job.result()
+        # audio is budgeted at its nominal rate; the overshoot check below catches the rest
+        sizes = [sz + int(a_bps / 8 * (ce - cs)) if audio else sz for sz, (cs, ce, _) in zip(sizes, chunks)]
+        i = 0
+        part_idx = 1
+        while i < len(chunks):
+            j = i
+            total = 0
+            while j < len(chunks) and (j == i or total + sizes[j] <= budget):
+                total += sizes[j]
+                j += 1
+            outfile = part_path(outdir, prefix, part_idx, infile.suffix)
+            tmp = temp_part(outfile)
+            while True:
+                list_file = chunkdir / f"part{part_idx:02d}.txt"
+                lines = []
+                for _, _, cf in chunks[i:j]:
+                    escaped = str(cf).replace("'", "'\\''")
+                    lines.append(f"file '{escaped}'")
+                list_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+                p = run_cmd(concat_cmd(list_file, tmp, audio, chunks[i][0], chunks[j - 1][1]))
+                if p.returncode != 0:
+                    discard(tmp)
+                    raise cmd_error(f"ffmpeg concat failed on part {part_idx}", p)
+                # container overhead can still tip a full part over; hand its last chunk on
+                if tmp.stat().st_size <= size_limit_bytes or j - i == 1:
+                    break
+                j -= 1
+            size = finalize_part(tmp, outfile).stat().st_size
+            print(f"Created: {outfile.name} ({bytes_to_human(size)} ≈ {chunks[j - 1][1] - chunks[i][0]:.2f}s)")
+            i = j
+            part_idx += 1
+    finally:
+        shutil.rmtree(chunkdir, ignore_errors=True)
+
+def two_pass_dir(root: Path, infile: Path, *params) -> Path:
+    # First-pass logs are only valid for this exact file and part layout.
+    st = infile.stat()
+    key = "|".join(str(x) for x in (infile.resolve(), st.st_size, st.st_mtime_ns) + params)
+    return root / ".blobserk-2pass" / hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def split_two_pass(infile: Path, duration: float, size_limit_bytes: int, v_bps: int, a_bps: int,
+                   outdir: Path, prefix: str, jobs: int, margin: float = 0.02):
+    """Two-pass libx264 per part. Each part gets the video bitrate that fills the size
+    budget over its exact duration (the last part keeps --video-bitrate); first-pass logs
+    are kept next to the probe cache so a re-run goes straight to the second pass."""
+    outdir.mkdir(parents=True, exist_ok=True)
+    sweep_temps(outdir, prefix)
+    kf_times = load_packet_index(str(infile)).kf_times
+    budget = int(size_limit_bytes * (1 - margin))
+    part_seconds = max(1.0, budget * 8 / (v_bps + a_bps))
+    parts = keyframe_ranges(kf_times, 0.0, duration, part_seconds)
+    statsdir = two_pass_dir(outdir, infile, f"{part_seconds:.3f}", v_bps, a_bps)
+    statsdir.mkdir(parents=True, exist_ok=True)
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    def part_bitrate(i):
+        s, e = parts[i]
+        fill = int(budget * 8 / max(e - s, 0.001)) - a_bps
+        return min(fill, v_bps) if i == len(parts) - 1 else fill
+    def analyse(i):
+        s, e = parts[i]
+        log = statsdir / f"part{i + 1:02d}"
+        if Path(f"{log}-0.log").exists():
+            return
+        cmd = ["ffmpeg", "-y", "-ss", f"{s:.6f}", "-i", str(infile), "-t", f"{e - s:.6f}",
+               "-map", "0:v:0", "-c:v", "libx264", "-preset", "veryfast", "-b:v", f"{part_bitrate(i)}",
+               "-pass", "1", "-passlogfile", str(log), "-threads", str(threads), "-an", "-f", "null", "-"]
+        p = run_cmd(cmd)
+        if p.returncode != 0:
+            shutil.rmtree(statsdir, ignore_errors=True)
+            raise cmd_error(f"first pass failed on part {i + 1}", p)
+    def encode(i):
+        s, e = parts[i]
+        outfile = part_path(outdir, prefix, i + 1, infile.suffix)
+        tmp = temp_part(outfile)
+        cmd = ["ffmpeg", "-y", "-ss", f"{s:.6f}", "-i", str(infile), "-t", f"{e - s:.6f}",
+               *encode_args(part_bitrate(i), a_bps), "-pass", "2", "-passlogfile", str(statsdir / f"part{i + 1:02d}"),
+               "-threads", str(threads), str(tmp)]
+        p = run_cmd(cmd)
+        if p.returncode != 0:
+            discard(tmp)
+            raise cmd_error(f"second pass failed on part {i + 1}", p)
+        return finalize_part(tmp, outfile)
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(parts)))) as ex:
+        list(ex.map(analyse, range(len(parts))))
+        for i, outfile in enumerate(ex.map(encode, range(len(parts)))):
+            size = outfile.stat().st_size
+            note = "  !! over limit" if size > size_limit_bytes else ""
+            s, e = parts[i]
+            print(f"Created: {outfile.name} ({bytes_to_human(size)} ≈ {e - s:.2f}s, v={part_bitrate(i)}bps){note}")
 
 def main():
     parser = argparse.ArgumentParser()
@@ -102,9 +813,18 @@ def main():
     parser.add_argument("--prefix", default=None)
     parser.add_argument("--simulate", action="store_true")
     parser.add_argument("--reencode", action="store_true")
+    parser.add_argument("--single-pass", action="store_true", help="read the input once and write all parts from one ffmpeg")
+    parser.add_argument("--balance", action="store_true", help="copy mode: equal-sized parts instead of filling each to the limit")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the probe cache in the output folder")
+    parser.add_argument("--part-jobs", type=int, default=1, help="copy mode: write up to N planned parts concurrently")
+    parser.add_argument("--target-size", action="store_true", help="re-encode with two-pass rate control sized to the limit")
+    parser.add_argument("--encode-jobs", type=int, default=1, help="re-encode: encode keyframe chunks on N workers (0 = all cores)")
+    parser.add_argument("--size-margin", type=float, default=2.0, help="re-encode: aim this many percent under --size-limit")
     parser.add_argument("--video-bitrate", default=None)
     parser.add_argument("--audio-bitrate", default="128k")
     args = parser.parse_args()
+    if args.target_size:
+        args.reencode = True
     require_bin("ffprobe")
     require_bin("ffmpeg")
     infile = Path(args.input).expanduser().resolve()
@@ -113,6 +833,8 @@ def main():
     size_limit_bytes = human_to_bytes(args.size_limit)
     outdir = Path(args.outdir).expanduser().resolve()
     prefix = args.prefix or infile.stem
+    if not args.no_cache:
+        open_probe_cache(outdir)
     duration, src_bitrate = get_media_info(str(infile))
     if duration <= 0:
         sys.exit(2)
@@ -130,7 +852,7 @@ def main():
             v_bps = parse_br(args.video_bitrate)
         a_bps = parse_br(args.audio_bitrate)
         est_size = estimate_size_bytes(duration, v_bps + a_bps)
-        mode = f"re-encode (v={v_bps}bps, a={a_bps}bps)"
+        mode = f"re-encode (v={v_bps}bps, a={a_bps}bps{', two-pass' if args.target_size else ''})"
     else:
         est_size = estimate_size_bytes(duration, src_bitrate) if src_bitrate > 0 else 0
         mode = "stream copy (no re-encode)"
@@ -144,35 +866,41 @@ def main():
         print(f"Estimated parts: ~{parts_est}")
     else:
         print("Estimated size: N/A")
+    plan = None
+    if not args.reencode:
+        try:
+            plan = plan_copy(str(infile), size_limit_bytes, duration, args.balance)
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            sys.exit(2)
+        print("Planned parts (keyframe-aligned):")
+        for i, pp in enumerate(plan, 1):
+            print(f"  part{i:02d}  {pp.start:.2f}s -> {pp.end:.2f}s  {bytes_to_human(pp.size)}")
+        print(f"Exact parts: {len(plan)}")
     if args.simulate:
         print("Simulation only.")
         return
     if not args.reencode:
-        split_by_size_copy(infile, size_limit_bytes, outdir, prefix)
+        try:
+            split_by_size_copy(infile, size_limit_bytes, outdir, prefix, plan, args.part_jobs, args.single_pass)
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            sys.exit(3)
     else:
-        outdir.mkdir(parents=True, exist_ok=True)
-        remaining = duration
-        start = 0.0
-        part_idx = 1
-        total_target_bps = v_bps + a_bps
-        approx_part_seconds = max(1, int((size_limit_bytes * 8) / total_target_bps))
-        while remaining > 0.2:
-            outfile = outdir / f"{prefix}_part{part_idx:02d}{infile.suffix}"
-            cmd = [
-                "ffmpeg", "-y", "-ss", f"{start}", "-i", str(infile),
-                "-map", "0:v:0", "-map", "0:a:0?",
-                "-c:v", "libx264", "-preset", "veryfast", "-b:v", f"{v_bps}",
-                "-c:a", "aac", "-b:a", f"{a_bps}",
-                "-t", f"{approx_part_seconds}", str(outfile)
-            ]
-            p = run_cmd(cmd)
-            if p.returncode != 0:
-                sys.exit(4)
-            actual = ffprobe_duration(str(outfile))
-            print(f"Created: {outfile.name} ({bytes_to_human(outfile.stat().st_size)} ≈ {actual:.2f}s)")
-            start += actual
-            remaining -= actual
-            part_idx += 1
+        margin = args.size_margin / 100
+        try:
+            jobs = args.encode_jobs if args.encode_jobs > 0 else (os.cpu_count() or 1)
+            if args.target_size:
+                split_two_pass(infile, duration, size_limit_bytes, v_bps, a_bps, outdir, prefix, jobs, margin)
+            elif args.single_pass:
+                split_reencode_single(infile, duration, size_limit_bytes, v_bps, a_bps, outdir, prefix, margin)
+            elif jobs > 1:
+                split_reencode_chunked(infile, duration, size_limit_bytes, v_bps, a_bps, outdir, prefix, jobs, margin)
+            else:
+                split_reencode(infile, duration, size_limit_bytes, v_bps, a_bps, outdir, prefix, margin)
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            sys.exit(4)
 
 if __name__ == "__main__":
     main()
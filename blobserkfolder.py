@@ -1,16 +1,15 @@
 #!/usr/bin/env python3
-import argparse, os, sys, subprocess, shutil, json, re, math, time, threading, random
+import argparse, os, sys, shutil, json, re, time, threading, random, itertools, heapq, collections, sqlite3, select, struct
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import blobserk
+from blobserk import build_segment_cmd, build_extract_cmd, part_path, plan_copy, open_probe_cache, PlannedPart
+from blobserk import temp_prefix, temp_part, temp_segments, sweep_temps, discard, finalize_part, finalize_segments, with_progress, progress_out_seconds, bytes_to_human
 
 # ---------- Utils ----------
 def require_bin(name):
     if not shutil.which(name):
         print(f"ERROR: '{name}' not found"); sys.exit(1)
 
-def run(cmd):
-    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
-
 def human_to_bytes(s):
     s=s.strip().lower().replace(" ","")
     m=re.match(r"^([0-9]*\.?[0-9]+)\s*([kmgt]?b?)?$",s)
@@ -19,153 +18,924 @@ def human_to_bytes(s):
     mult={"":1,"k":1024,"m":1024**2,"g":1024**3,"t":1024**4}[u]
     return int(v*mult)
 
-def ffprobe_json(p):
-    r=run(["ffprobe","-v","error","-print_format","json","-show_format","-show_streams",p])
-    if r.returncode!=0: return {}
-    return json.loads(r.stdout.decode("utf-8","ignore"))
-
 def duration(p):
-    try:
-        f=ffprobe_json(p).get("format",{}); return float(f.get("duration",0.0)) if f.get("duration") else 0.0
-    except: return 0.0
+    # duration-only probe, shared with blobserk.py so both scripts hit the same cache
+    return blobserk.probe_duration(p)
+
+VIDEO_EXTS={".mp4",".mov",".m4v",".mkv",".avi",".wmv",".webm",".ts",".m2ts",".flv",".mpg",".mpeg"}
 
 def is_video(path):
-    exts={".mp4",".mov",".m4v",".mkv",".avi",".wmv",".webm",".ts",".m2ts",".flv",".mpg",".mpeg"}
-    return path.suffix.lower() in exts
+    return path.suffix.lower() in VIDEO_EXTS
 
-# ---------- Fancy console animations ----------
-class Animator:
+# ---------- Console display ----------
+def anim_frames(style):
+    if style=="snake": return ["["+(" "*i+"o~~~").ljust(12)[:12]+"]" for i in list(range(9))+list(range(7,0,-1))]
+    if style=="bounce": return ["["+" "*i+"●"+" "*(8-i)+"]" for i in list(range(9))+list(range(7,0,-1))]
+    if style=="dots": return ["   ",".  ",".. ","..."]
+    if style=="earth": return ["🌍","🌎","🌏"]
+    if style=="none": return [""]
+    return ["|","/","-","\\"]
+
+class Display:
+    """Owns stdout while jobs run. One thread redraws a dashboard with a line per active
+    job (plus the footer, e.g. the batch ETA) every interval seconds, and log() prints
+    above it, so concurrent workers never write over each other. When stdout is not a
+    TTY (cron, systemd) nothing is redrawn: active jobs are logged as plain lines every
+    log_interval seconds instead."""
     STYLES = ("spinner","snake","bounce","dots","earth","none")
-    def __init__(self, style="auto", label="Processing"):
-        self.label = label
+
+    def __init__(self, style="auto", footer=None, interval=0.25, log_interval=30.0, tty=None):
         if style in ("auto","random"):
-            self.style = random.choice([s for s in self.STYLES if s!="none"])
-        else:
-            self.style = style if style in self.STYLES else "spinner"
+            style = random.choice([s for s in self.STYLES if s!="none"])
+        self.frames = anim_frames(style if style in self.STYLES else "spinner")
+        self.footer, self.interval, self.log_interval = footer, interval, log_interval
+        self.tty = sys.stdout.isatty() if tty is None else tty
+        self.lock = threading.Lock()
+        self.jobs = {}          # id -> [label, status]
+        self.ids = itertools.count()
+        self.drawn = 0; self.tick = 0; self.last_log = time.monotonic()
         self.stop_flag = threading.Event()
         self.thread = threading.Thread(target=self._run, daemon=True)
 
     def start(self):
-        try: sys.stdout.write("\x1b[?25l")
-        except: pass
+        if self.tty: sys.stdout.write("\x1b[?25l")
         self.thread.start()
 
-    def stop(self, suffix_msg=""):
+    def stop(self):
         self.stop_flag.set()
         self.thread.join(timeout=1.0)
-        try:
-            sys.stdout.write("\r" + " " * 140 + "\r")
-            sys.stdout.write("\x1b[?25h")
-            if suffix_msg:
-                sys.stdout.write(suffix_msg + "\n")
+        with self.lock:
+            self._clear()
+            if self.tty: sys.stdout.write("\x1b[?25h")
             sys.stdout.flush()
-        except: pass
+
+    def add(self, label):
+        with self.lock:
+            jid = next(self.ids); self.jobs[jid] = [label, ""]
+            return jid
+
+    def update(self, jid, status):
+        with self.lock:
+            if jid in self.jobs: self.jobs[jid][1] = status
+
+    def remove(self, jid):
+        with self.lock: self.jobs.pop(jid, None)
+
+    def log(self, msg):
+        with self.lock:
+            self._clear()
+            sys.stdout.write(f"{msg}\n")
+            self._draw()
+
+    def _lines(self, frame=""):
+        lines = [f"{frame} {label}  {status}".strip() for label, status in self.jobs.values()]
+        if self.footer and self.jobs: lines.append(self.footer())
+        return lines
+
+    def _clear(self):
+        if self.drawn: sys.stdout.write(f"\x1b[{self.drawn}F\x1b[J")
+        self.drawn = 0
+
+    def _draw(self):
+        if not self.tty: return sys.stdout.flush()
+        width = max(20, shutil.get_terminal_size().columns - 1)   # a wrapped line would break _clear
+        lines = [l[:width] for l in self._lines(self.frames[self.tick % len(self.frames)])]
+        for l in lines: sys.stdout.write(l + "\n")
+        self.drawn = len(lines)
+        sys.stdout.flush()
 
     def _run(self):
-        if self.style == "none": return
-        elif self.style == "snake": self._snake()
-        elif self.style == "bounce": self._bounce()
-        elif self.style == "dots": self._dots()
-        elif self.style == "earth": self._earth()
-        else: self._spinner()
-
-    def _spinner(self):
-        frames = ["|","/","-","\\"]
-        i=0
-        while not self.stop_flag.is_set():
-            sys.stdout.write(f"\r{self.label}  {frames[i%len(frames)]}")
-            sys.stdout.flush(); i+=1; time.sleep(0.08)
-
-    def _snake(self):
-        width = 38; body = "o~~~"
-        pos=0; direction=1
-        while not self.stop_flag.is_set():
-            line = " " * pos + body
-            line = line[:width]
-            sys.stdout.write(f"\r{self.label}  [{line:<{width}}]")
-            sys.stdout.flush()
-            pos += direction
-            if pos <= 0: direction = 1
-            if pos + len(body) >= width: direction = -1
-            time.sleep(0.05)
-
-    def _bounce(self):
-        width = 20; pos = 0; dir = 1
-        while not self.stop_flag.is_set():
-            bar = " " * pos + "●" + " " * (width-pos)
-            sys.stdout.write(f"\r{self.label}  [{bar}]")
-            sys.stdout.flush()
-            pos += dir
-            if pos<=0: dir=1
-            if pos>=width: dir=-1
-            time.sleep(0.04)
-
-    def _dots(self):
-        i=0
-        while not self.stop_flag.is_set():
-            dots = "." * (i%4)
-            sys.stdout.write(f"\r{self.label}  {dots:<3}")
-            sys.stdout.flush(); i+=1; time.sleep(0.3)
-
-    def _earth(self):
-        frames = ["🌍","🌎","🌏","🌍","🌎","🌏"]
-        i=0
-        while not self.stop_flag.is_set():
-            sys.stdout.write(f"\r{self.label}  {frames[i%len(frames)]}")
-            sys.stdout.flush(); i+=1; time.sleep(0.15)
-
-def run_with_animation(cmd_list, anim_style, label):
-    p = subprocess.Popen(cmd_list, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    anim = Animator(anim_style, label)
-    anim.start()
-    p.wait()
-    anim.stop()
+        while not self.stop_flag.wait(self.interval):
+            with self.lock:
+                self.tick += 1
+                if self.tty:
+                    self._clear(); self._draw()
+                elif self.jobs and time.monotonic()-self.last_log >= self.log_interval:
+                    self.last_log = time.monotonic()
+                    for l in self._lines(): sys.stdout.write(f"[{time.strftime('%H:%M:%S')}] {l}\n")
+                    sys.stdout.flush()
+
+display = None   # set by main; everything below prints through say()
+
+def say(msg):
+    if display: display.log(msg)
+    else: print(msg)
+
+def run_job(cmd_list, label, task=None):
+    # with a task, ffmpeg reports -progress on stdout and the job's dashboard line shows
+    # that part's bytes, out_time, speed and throughput plus the file's progress
+    jid = display.add(label) if display else None
+    def feed(stats):
+        task.feed(stats)
+        if display: display.update(jid, task.line())
+    try:
+        if task: p = blobserk.run_cmd(with_progress(cmd_list), on_progress=feed)
+        else: p = blobserk.run_cmd(cmd_list)
+    finally:
+        if display: display.remove(jid)
     return p.returncode
 
+# ---------- Progress ----------
+def fmt_hms(sec):
+    if sec is None: return "--:--:--"
+    sec=int(sec); return f"{sec//3600:02d}:{sec%3600//60:02d}:{sec%60:02d}"
+
+class Progress:
+    """Batch progress fed by ffmpeg's -progress stream, counted in input bytes: every
+    queued file adds its size to the total and a running part has done the share of its
+    planned bytes that its out_time covers of its length. The batch ETA is the bytes
+    left over the rate achieved since the first part started."""
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.total=0; self.done=0.0; self.t0=None
+        self.files={}   # path -> {"size","file_size","scale","credited","written","t0"}
+
+    def queue(self, f):
+        try: size=f.stat().st_size
+        except OSError: return
+        with self.lock:
+            if f in self.files: return
+            # size shrinks as --resume drops finished parts; file_size stays the source's size
+            self.files[f]={"size":size, "file_size":size, "scale":1.0, "credited":0.0, "written":0, "t0":None}
+            self.total+=size
+
+    def plan(self, f, plan):
+        # planned sizes count packet payload only; scale them up to the file size
+        with self.lock:
+            st=self.files.get(f)
+            if st: st["scale"]=st["size"]/max(1, sum(pp.size for pp in plan))
+
+    def task(self, f, planned_bytes, seconds):
+        st=self.files.get(f)
+        return PartTask(self, f, planned_bytes*(st["scale"] if st else 1.0), seconds)
+
+    def drop(self, f, planned_bytes):
+        # a part already on disk (--resume) is neither work done nor work left
+        with self.lock:
+            st=self.files.get(f)
+            if not st: return
+            n=min(planned_bytes*st["scale"], st["size"]-st["credited"])
+            st["size"]-=n; self.total-=n
+
+    def update(self, f, in_bytes, out_bytes):
+        with self.lock:
+            now=time.monotonic()
+            if self.t0 is None: self.t0=now
+            st=self.files.get(f)
+            if not st: return
+            if st["t0"] is None: st["t0"]=now
+            in_bytes=max(0.0, min(in_bytes, st["size"]-st["credited"]))
+            st["credited"]+=in_bytes; st["written"]+=out_bytes; self.done+=in_bytes
+
+    def finish(self, f, ok):
+        # credit what ffmpeg's estimate left over, or take a failed/skipped file out of the total
+        with self.lock:
+            st=self.files.pop(f, None)
+            if not st: return None
+            rest=st["size"]-st["credited"]
+            if ok: self.done+=rest
+            else: self.total-=rest
+            return st
+
+    def file_pct(self, f):
+        st=self.files.get(f)
+        return 100*st["credited"]/st["size"] if st and st["size"] else 100.0
+
+    def batch(self):
+        with self.lock:
+            pct=100*self.done/self.total if self.total>0 else 100.0
+            elapsed=time.monotonic()-self.t0 if self.t0 else 0
+            eta=(self.total-self.done)*elapsed/self.done if self.done>0 and elapsed>=1 else None
+        return f"batch {pct:.0f}% ETA {fmt_hms(eta)}"
+
+    def file_summary(self, f, st):
+        if not st or st["t0"] is None: return ""
+        dt=max(time.monotonic()-st["t0"], 1e-6)
+        return f"  ({bytes_to_human(st['written'])} in {fmt_hms(dt)}, {st['written']/dt/1e6:.1f} MB/s; {self.batch()})"
+
+class PartTask:
+    """One ffmpeg run's share of a file: in_bytes of input turned into seconds of output."""
+    def __init__(self, progress, f, in_bytes, seconds):
+        self.progress, self.f, self.in_bytes, self.seconds = progress, f, in_bytes, seconds
+        self.t0=time.monotonic(); self.in_done=0.0; self.written=0; self.stats={}
+
+    def feed(self, stats):
+        self.stats=stats
+        frac=min(1.0, progress_out_seconds(stats)/self.seconds) if self.seconds>0 else 0.0
+        try: written=int(stats.get("total_size", self.written))
+        except ValueError: written=self.written
+        self.progress.update(self.f, frac*self.in_bytes-self.in_done, written-self.written)
+        self.in_done=frac*self.in_bytes; self.written=written
+
+    def finish(self, size):
+        self.progress.update(self.f, self.in_bytes-self.in_done, size-self.written)
+        self.in_done=self.in_bytes; self.written=size
+
+    def rate(self):
+        return self.written/max(time.monotonic()-self.t0, 1e-6)/1e6
+
+    def line(self):
+        pct=100*self.in_done/self.in_bytes if self.in_bytes else 0
+        speed=self.stats.get("speed", "N/A").strip()
+        return (f"{pct:3.0f}%  {bytes_to_human(self.written)}  t={fmt_hms(progress_out_seconds(self.stats))}"
+                f"  {speed}  {self.rate():.1f} MB/s | file {self.progress.file_pct(self.f):.0f}%")
+
+# ---------- Resume journal ----------
+class Journal:
+    """Append-only JSON-lines record under the output root of each file's cut plan and of
+    every part written and size-checked, so --resume continues mid-file without
+    re-probing or re-writing finished parts. Entries are keyed by source path, size,
+    mtime and split settings; a modified source starts over."""
+    FILENAME=".blobserk-journal.jsonl"
+
+    def __init__(self, path):
+        self.lock=threading.Lock()
+        self.state={}
+        if path.exists():
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    try: self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError): pass   # torn last line after a crash
+        self.fh=open(path, "a", encoding="utf-8")
+        # end a torn last line so the next record does not get glued onto it
+        if self.fh.tell()>0:
+            with open(path, "rb") as fh:
+                fh.seek(-1, os.SEEK_END)
+                if fh.read(1)!=b"\n": self.fh.write("\n"); self.fh.flush()
+
+    @staticmethod
+    def key(infile, limit, balance):
+        st=infile.stat()
+        return [str(infile), st.st_size, st.st_mtime_ns, limit, bool(balance)]
+
+    def _apply(self, rec):
+        src,ev=rec["src"],rec["event"]
+        if ev=="plan":
+            self.state[src]={"key":rec["key"], "plan":[PlannedPart(*p) for p in rec["parts"]], "done":{}, "complete":False}
+            return
+        st=self.state.get(src)
+        if st is None or st["key"]!=rec["key"]: return
+        if ev=="part": st["done"][rec["idx"]]=rec["bytes"]
+        elif ev=="done": st["complete"]=True
+
+    def _append(self, rec):
+        with self.lock:
+            self._apply(rec)
+            self.fh.write(json.dumps(rec)+"\n"); self.fh.flush()
+
+    def lookup(self, infile, limit, balance):
+        with self.lock:
+            st=self.state.get(str(infile))
+            return st if st and st["key"]==self.key(infile, limit, balance) else None
+
+    def record_plan(self, infile, limit, balance, plan):
+        self._append({"event":"plan", "src":str(infile), "key":self.key(infile, limit, balance), "parts":[list(pp) for pp in plan]})
+
+    def part_done(self, infile, idx, outfile):
+        # finished = still on disk with the size we recorded when it was written
+        st=self.state.get(str(infile))
+        return bool(st) and idx in st["done"] and outfile.exists() and outfile.stat().st_size==st["done"][idx]
+
+    def record_part(self, infile, idx, size):
+        st=self.state.get(str(infile))
+        if st is None: return
+        self._append({"event":"part", "src":str(infile), "key":st["key"], "idx":idx, "bytes":size})
+        if len(st["done"])==len(st["plan"]) and not st["complete"]:
+            self._append({"event":"done", "src":str(infile), "key":st["key"]})
+
+# ---------- Event log ----------
+class EventLog:
+    """--events: one JSON object per line for every job queued, started and finished,
+    every part written or failed and every ffprobe run, each stamped with the wall
+    clock ("ts") so throughput and failure rates can be computed from the file alone."""
+    def __init__(self, path):
+        self.lock=threading.Lock()
+        self.fh=open(path, "a", encoding="utf-8")
+
+    def emit(self, event, **fields):
+        rec={"ts":round(time.time(),3), "event":event, **fields}
+        with self.lock:
+            self.fh.write(json.dumps(rec, ensure_ascii=False)+"\n"); self.fh.flush()
+
+    def on_cmd(self, cmd, rc, seconds):
+        # ffmpeg runs are reported as part events by the caller, which knows what they wrote
+        if os.path.basename(cmd[0]).startswith("ffprobe"):
+            what=cmd[cmd.index("-show_entries")+1] if "-show_entries" in cmd else "format,streams"
+            self.emit("probe", file=cmd[-1], entries=what, rc=rc, wall=round(seconds,3))
+
+# ---------- Metrics ----------
+class Histogram:
+    BUCKETS=(0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+    def __init__(self):
+        self.counts=[0]*len(self.BUCKETS); self.sum=0.0; self.count=0
+
+    def observe(self, v):
+        for i,b in enumerate(self.BUCKETS):
+            if v<=b: self.counts[i]+=1
+        self.sum+=v; self.count+=1
+
+    def lines(self, name, labels=""):
+        sep="," if labels else ""
+        out=[f'{name}_bucket{{{labels}{sep}le="{b:g}"}} {c}' for b,c in zip(self.BUCKETS, self.counts)]
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        tail=f"{{{labels}}}" if labels else ""
+        return out+[f"{name}_sum{tail} {self.sum:.3f}", f"{name}_count{tail} {self.count}"]
+
+class Metrics:
+    """--metrics: Prometheus text format for node_exporter's textfile collector, rewritten
+    every interval seconds (and once at exit) through a temp file and os.replace so the
+    collector never reads half a file. Counters are fed from the same events as
+    --events; queue depth and active workers are read from the scheduler when there is
+    one, otherwise they count files waiting and running."""
+    def __init__(self, path, interval=15.0):
+        self.path, self.interval = path, interval
+        self.lock=threading.Lock()
+        self.files=collections.Counter(); self.parts=collections.Counter()
+        self.bytes_in=0; self.bytes_out=0
+        self.part_wall=Histogram()
+        self.runs=collections.Counter(); self.run_wall=collections.defaultdict(Histogram)
+        self.waiting=0; self.running=0
+        self.sched=None
+        self.stop_flag=threading.Event()
+        self.thread=threading.Thread(target=self._run, daemon=True)
+
+    def on_event(self, event, f):
+        with self.lock:
+            if event=="job_queued": self.waiting+=1
+            elif event=="job_started":
+                self.waiting-=1; self.running+=1
+            elif event=="job_finished":
+                if f["status"]=="skipped": self.waiting-=1
+                else: self.running-=1
+                self.files[f["status"]]+=1
+                if f["status"]=="done": self.bytes_in+=f.get("bytes_in") or 0
+            elif event in ("part_written","part_failed"):
+                self.parts["written" if event=="part_written" else "failed"]+=1
+                if event=="part_written": self.bytes_out+=f["bytes"]
+                if not f.get("single_pass"): self.part_wall.observe(f["wall"])
+
+    def on_cmd(self, cmd, rc, seconds):
+        name="ffprobe" if os.path.basename(cmd[0]).startswith("ffprobe") else "ffmpeg"
+        with self.lock:
+            self.runs[(name, "ok" if rc==0 else "error")]+=1
+            self.run_wall[name].observe(seconds)
+
+    def render(self):
+        with self.lock:
+            if self.sched:
+                depth, active = self.sched.outstanding-self.sched.running, self.sched.running
+            else:
+                depth, active = max(0, self.waiting), max(0, self.running)
+            out=["# HELP blobserk_files_total Files finished, by status.", "# TYPE blobserk_files_total counter"]
+            out+=[f'blobserk_files_total{{status="{k}"}} {self.files[k]}' for k in ("done","failed","skipped")]
+            out+=["# HELP blobserk_parts_total Parts written or failed.", "# TYPE blobserk_parts_total counter"]
+            out+=[f'blobserk_parts_total{{status="{k}"}} {self.parts[k]}' for k in ("written","failed")]
+            out+=["# HELP blobserk_input_bytes_total Size of source files split successfully.", "# TYPE blobserk_input_bytes_total counter",
+                  f"blobserk_input_bytes_total {self.bytes_in}"]
+            out+=["# HELP blobserk_output_bytes_total Bytes of parts written.", "# TYPE blobserk_output_bytes_total counter",
+                  f"blobserk_output_bytes_total {self.bytes_out}"]
+            out+=["# HELP blobserk_part_wall_seconds Wall time of one ffmpeg run writing one part.", "# TYPE blobserk_part_wall_seconds histogram"]
+            out+=self.part_wall.lines("blobserk_part_wall_seconds")
+            out+=["# HELP blobserk_process_runs_total ffmpeg/ffprobe processes run, by result.", "# TYPE blobserk_process_runs_total counter"]
+            out+=[f'blobserk_process_runs_total{{bin="{b}",result="{r}"}} {n}' for (b,r),n in sorted(self.runs.items())]
+            out+=["# HELP blobserk_process_seconds Wall time of ffmpeg/ffprobe processes.", "# TYPE blobserk_process_seconds histogram"]
+            for b,h in sorted(self.run_wall.items()): out+=h.lines("blobserk_process_seconds", f'bin="{b}"')
+            out+=["# HELP blobserk_queue_depth Tasks waiting for a worker.", "# TYPE blobserk_queue_depth gauge", f"blobserk_queue_depth {depth}"]
+            out+=["# HELP blobserk_active_workers Tasks running.", "# TYPE blobserk_active_workers gauge", f"blobserk_active_workers {active}"]
+            out+=["# HELP blobserk_last_update_timestamp_seconds When this file was written.", "# TYPE blobserk_last_update_timestamp_seconds gauge",
+                  f"blobserk_last_update_timestamp_seconds {time.time():.0f}"]
+        return "\n".join(out)+"\n"
+
+    def write(self):
+        tmp=self.path.with_name(f".{self.path.name}.tmp")   # the collector only reads *.prom
+        try:
+            tmp.write_text(self.render(), encoding="utf-8"); os.replace(tmp, self.path)
+        except OSError as e: say(f"WARN metrics: {e}")
+
+    def _run(self):
+        while not self.stop_flag.wait(self.interval): self.write()
+
+    def start(self):
+        self.write(); self.thread.start()
+
+    def stop(self):
+        self.stop_flag.set(); self.thread.join(timeout=1.0); self.write()
+
+events = None    # set by main with --events
+metrics = None   # set by main with --metrics
+
+def emit(event, **fields):
+    if events: events.emit(event, **fields)
+    if metrics: metrics.on_event(event, fields)
+
 # ---------- Split logic ----------
-def split_copy(infile, limit_bytes, outdir, prefix, anim_style):
-    outdir.mkdir(parents=True, exist_ok=True)
+def get_plan(infile, limit_bytes, balance, journal=None):
+    if journal:
+        entry=journal.lookup(infile, limit_bytes, balance)
+        if entry: return entry["plan"]
     d=duration(str(infile))
-    if d<=0: 
-        print(f"Skip (no duration): {infile}")
-        return
-    i=1; off=0.0
-    while True:
-        outfile = outdir / f"{prefix}_part{i:02d}{infile.suffix}"
-        cmd = ["ffmpeg","-y","-ss",f"{off}","-i",str(infile),"-c","copy","-fs",f"{limit_bytes}",str(outfile)]
-        rc = run_with_animation(cmd, anim_style, f"{infile.name} → part {i:02d}")
-        if rc!=0:
-            print(f"ERROR ffmpeg ({infile.name} part {i:02d})"); break
-        cd = duration(str(outfile))
-        if cd<=0.2:
-            try: outfile.unlink()
-            except: pass
-            break
-        size = outfile.stat().st_size
-        print(f"✓ {outfile.name}  ({size} bytes ~ {cd:.2f}s)")
-        off += cd; i += 1
-        if off+0.2 >= d: break
+    if d<=0:
+        say(f"Skip (no duration): {infile}"); return None
+    try: plan=plan_copy(str(infile), limit_bytes, d, balance)
+    except RuntimeError as e:
+        say(f"ERROR {e} ({infile.name})"); return None
+    if journal: journal.record_plan(infile, limit_bytes, balance, plan)
+    return plan
+
+def split_copy(infile, limit_bytes, outdir, prefix, single_pass=False, balance=False, journal=None, progress=None):
+    outdir.mkdir(parents=True, exist_ok=True)
+    sweep_temps(outdir, prefix)
+    plan=get_plan(infile, limit_bytes, balance, journal)
+    if plan is None: return False
+    if progress: progress.plan(infile, plan)
+    # a journaled file with parts already written resumes part by part: the segment
+    # muxer can only rewrite the whole file
+    entry=journal.lookup(infile, limit_bytes, balance) if journal else None
+    if single_pass and not (entry and entry["done"]):
+        return split_single_pass(infile, plan, limit_bytes, outdir, prefix, journal, progress)
+    # keyframe-aligned plan: consecutive parts never share a GOP
+    for i,pp in enumerate(plan,1):
+        if not extract_part(infile, pp, part_path(outdir, prefix, i, infile.suffix), limit_bytes, i, len(plan), journal, progress): return False
+    return True
+
+def extract_part(infile, pp, outfile, limit_bytes, i, n, journal=None, progress=None):
+    if journal and journal.part_done(infile, i, outfile):
+        if progress: progress.drop(infile, pp.size)
+        say(f"↷ {outfile.name}  (already done)"); return True
+    outfile.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_part(outfile)
+    task = progress.task(infile, pp.size, pp.end-pp.start) if progress else None
+    t0 = time.monotonic()
+    rc = run_job(build_extract_cmd(infile, pp, tmp, i==n), f"{infile.name} → part {i:02d}/{n}", task)
+    wall = round(time.monotonic()-t0, 3)
+    if rc!=0:
+        discard(tmp); say(f"ERROR ffmpeg ({infile.name} part {i:02d})")
+        emit("part_failed", file=str(infile), part=i, of=n, rc=rc, wall=wall, error="ffmpeg"); return False
+    if tmp.exists() and tmp.stat().st_size>limit_bytes:
+        size=tmp.stat().st_size; discard(tmp)
+        say(f"ERROR over limit ({outfile.name}, {size} bytes)")
+        emit("part_failed", file=str(infile), part=i, of=n, rc=rc, wall=wall, error="over limit", bytes=size); return False
+    try: size = finalize_part(tmp, outfile).stat().st_size
+    except RuntimeError:
+        say(f"ERROR empty part ({outfile.name})")
+        emit("part_failed", file=str(infile), part=i, of=n, rc=rc, wall=wall, error="empty"); return False
+    # copy mode has no retry loop; the field keeps one schema for every writer
+    emit("part_written", file=str(infile), part=i, of=n, path=str(outfile), bytes=size,
+         duration=round(pp.end-pp.start,3), wall=wall, rc=rc, retries=0)
+    rate = ""
+    if task:
+        task.finish(size); rate=f", {task.rate():.1f} MB/s"
+    say(f"✓ {outfile.name}  ({size} bytes ~ {pp.end-pp.start:.2f}s{rate})")
+    if journal: journal.record_part(infile, i, size)
+    return True
+
+def split_single_pass(infile, plan, limit_bytes, outdir, prefix, journal=None, progress=None):
+    tmp_prefix=temp_prefix(prefix)
+    cmd=build_segment_cmd(infile, [pp.start for pp in plan[1:]], outdir, tmp_prefix)
+    # the segment muxer resets timestamps per part, ffmpeg's out_time runs over the whole file
+    task=progress.task(infile, sum(pp.size for pp in plan), plan[-1].end) if progress else None
+    t0=time.monotonic()
+    rc=run_job(cmd, f"{infile.name} → {len(plan)} part(s)", task)
+    wall=round(time.monotonic()-t0, 3)
+    if rc!=0:
+        for f in temp_segments(outdir, tmp_prefix, infile.suffix): discard(f)
+        say(f"ERROR ffmpeg ({infile.name} segment)")
+        emit("part_failed", file=str(infile), part=None, of=len(plan), rc=rc, wall=wall, error="ffmpeg"); return False
+    try: parts=finalize_segments(outdir, tmp_prefix, prefix, infile.suffix)
+    except RuntimeError as e:
+        say(f"ERROR {e}")
+        emit("part_failed", file=str(infile), part=None, of=len(plan), rc=rc, wall=wall, error=str(e)); return False
+    if task: task.finish(sum(f.stat().st_size for f in parts))
+    ok=True
+    for i,f in enumerate(parts,1):
+        size=f.stat().st_size
+        # one ffmpeg wrote every part: wall is that run's, shared by all of them
+        if size>limit_bytes:
+            discard(f); ok=False
+            say(f"ERROR over limit ({f.name}, {size} bytes)")
+            emit("part_failed", file=str(infile), part=i, of=len(plan), rc=rc, wall=wall, error="over limit", bytes=size)
+            continue
+        say(f"✓ {f.name}  ({size} bytes)")
+        if journal and size>0: journal.record_part(infile, i, size)
+        emit("part_written", file=str(infile), part=i, of=len(plan), path=str(f), bytes=size,
+             duration=round(plan[i-1].end-plan[i-1].start,3), wall=wall, rc=rc, retries=0, single_pass=True)
+    return ok
 
 # ---------- Batch driver ----------
-def gather_files(base: Path, recursive: bool):
-    files=[]
-    if recursive:
-        for p in base.rglob("*"):
-            if p.is_file() and is_video(p): files.append(p)
-    else:
-        for p in base.iterdir():
-            if p.is_file() and is_video(p): files.append(p)
+def walk_videos(base: Path, recursive: bool, stats=None):
+    """Yield video files under base as they are found. os.scandir hands back the dirent
+    type, so sidecar files and directories cost no stat call; a directory is descended
+    whatever its name (clips.mp4/ included). Symlinked directories are not followed."""
+    stack=[str(base)]
+    while stack:
+        try: it=os.scandir(stack.pop())
+        except OSError: continue
+        with it:
+            for e in it:
+                if stats is not None: stats["entries"]+=1
+                if e.is_dir(follow_symlinks=False):
+                    if recursive: stack.append(e.path)
+                elif os.path.splitext(e.name)[1].lower() in VIDEO_EXTS and e.is_file():
+                    yield Path(e.path)
+
+class ScanIndex:
+    """Snapshot of input trees kept under the output root: directory mtimes plus size,
+    mtime and status of every video seen. An --incremental walk lists only directories
+    whose mtime changed (adding, removing or renaming an entry bumps it), re-stats just
+    the known videos elsewhere, and yields only files that are new, modified or not yet
+    split successfully with the current split settings."""
+    FILENAME=".blobserk-index.sqlite"
+
+    def __init__(self, path, limit, balance):
+        self.lock=threading.Lock()
+        self.settings=f"{limit}:{int(bool(balance))}"   # same split settings as Journal.key
+        self.db=sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER, recursive INTEGER);"
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime_ns INTEGER, status TEXT, settings TEXT);")
+        if "settings" not in [r[1] for r in self.db.execute("PRAGMA table_info(files)")]:
+            self.db.execute("ALTER TABLE files ADD COLUMN settings TEXT"); self.db.commit()
+
+    def _q(self, sql, args=()):
+        with self.lock:
+            rows=self.db.execute(sql, args).fetchall()
+            self.db.commit()
+            return rows
+
+    def _forget_tree(self, d):
+        # prefix compare, not LIKE: "_" and "%" are common in folder names
+        sub=d.rstrip(os.sep)+os.sep
+        self._q("DELETE FROM files WHERE dir=? OR substr(dir,1,?)=?", (d, len(sub), sub))
+        self._q("DELETE FROM dirs WHERE path=? OR substr(path,1,?)=?", (d, len(sub), sub))
+
+    def _check(self, path, d, st, known):
+        # known: (size, mtime_ns, status, settings) from the index, or None
+        if known and known[2]=="done" and (known[0],known[1],known[3])==(st.st_size,st.st_mtime_ns,self.settings):
+            return False
+        self._q("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?)", (path, d, st.st_size, st.st_mtime_ns, "pending", self.settings))
+        return True
+
+    def walk(self, base, recursive, stats=None):
+        stack=[str(base)]
+        while stack:
+            d=stack.pop()
+            try: dst=os.stat(d)
+            except OSError:
+                self._forget_tree(d); continue
+            known_files={r[0]:r[1:] for r in self._q("SELECT path,size,mtime_ns,status,settings FROM files WHERE dir=?", (d,))}
+            row=self._q("SELECT mtime_ns,recursive FROM dirs WHERE path=?", (d,))
+            if row and row[0][0]==dst.st_mtime_ns and (row[0][1] or not recursive):
+                if recursive: stack.extend(r[0] for r in self._q("SELECT path FROM dirs WHERE parent=?", (d,)))
+                for path,known in known_files.items():
+                    try: st=os.stat(path)
+                    except OSError:
+                        self._q("DELETE FROM files WHERE path=?", (path,)); continue
+                    if self._check(path, d, st, known): yield Path(path)
+                continue
+            seen_dirs=set()
+            try: it=os.scandir(d)
+            except OSError: continue
+            with it:
+                for e in it:
+                    if stats is not None: stats["entries"]+=1
+                    if e.is_dir(follow_symlinks=False):
+                        if recursive: seen_dirs.add(e.path); stack.append(e.path)
+                    elif os.path.splitext(e.name)[1].lower() in VIDEO_EXTS and e.is_file():
+                        known=known_files.pop(e.path, None)
+                        if self._check(e.path, d, e.stat(), known): yield Path(e.path)
+            for gone in known_files: self._q("DELETE FROM files WHERE path=?", (gone,))
+            if recursive:
+                for (sub,) in self._q("SELECT path FROM dirs WHERE parent=?", (d,)):
+                    if sub not in seen_dirs: self._forget_tree(sub)
+            # mtime taken before listing: a change made during the walk triggers a rescan
+            self._q("INSERT OR REPLACE INTO dirs VALUES (?,?,?,?)", (d, os.path.dirname(d), dst.st_mtime_ns, int(recursive)))
+
+    def mark(self, f, status):
+        self._q("UPDATE files SET status=?, settings=? WHERE path=?", (status, self.settings, str(f)))
+
+def report_discovery(stats, found, t0):
+    dt=max(time.perf_counter()-t0, 1e-6)
+    say(f"Discovery: {stats['entries']} entries, {found} video(s) in {dt:.2f}s ({stats['entries']/dt:.0f} entries/s)")
+
+def discover(base, recursive, stats, index=None):
+    return index.walk(base, recursive, stats) if index else walk_videos(base, recursive, stats)
+
+def gather_files(base: Path, recursive: bool, index=None):
+    stats={"entries":0}; t0=time.perf_counter()
+    files=list(discover(base, recursive, stats, index))
+    report_discovery(stats, len(files), t0)
     return files
 
-def process_one(f, base, outroot, limit, skip_existing, anim):
+def skip_job(f, reason, opts):
+    if opts.index: opts.index.mark(f, "done")
+    opts.progress.finish(f, False)
+    emit("job_finished", file=str(f), status="skipped", reason=reason)
+
+def gone_job(f, opts):
+    # deleted or renamed since discovery (common with --stream/--watch)
+    opts.progress.finish(f, False)
+    emit("job_finished", file=str(f), status="skipped", reason="gone")
+    return f"Skip (gone): {f}"
+
+def finish_job(f, ok, t0, opts):
+    if opts.index: opts.index.mark(f, "done" if ok else "failed")
+    st=opts.progress.finish(f, ok)
+    emit("job_finished", file=str(f), status="done" if ok else "failed", bytes_in=st["file_size"] if st else None,
+         bytes_out=st["written"] if st else 0, wall=round(time.monotonic()-t0,3))
+    return f"Done: {f}{opts.progress.file_summary(f, st)}"
+
+def skip_reason(f, outdir, limit, opts):
+    # with --resume the journal decides first: an unfinished entry means a crashed run,
+    # whose part01 is on disk, so --skip-existing only applies to files it never saw
+    entry=opts.journal.lookup(f, limit, opts.balance) if opts.journal else None
+    if entry: return "journal" if entry["complete"] else None
+    if opts.skip_existing and (outdir/f"{f.stem}_part01{f.suffix}").exists(): return "exists"
+    return None
+
+def process_one(f, base, outroot, limit, opts):
     rel=f.relative_to(base)
     outdir=outroot/rel.parent
     prefix=f.stem
-    first_part=outdir/f"{prefix}_part01{f.suffix}"
-    if skip_existing and first_part.exists():
-        return f"Skip (exists): {f}"
-    split_copy(f, limit, outdir, prefix, anim)
-    return f"Done: {f}"
+    try:
+        reason=skip_reason(f, outdir, limit, opts)
+        if reason:
+            skip_job(f, reason, opts)
+            return f"Skip ({reason}): {f}"
+        opts.progress.queue(f)
+        emit("job_started", file=str(f)); t0=time.monotonic()
+        ok=split_copy(f, limit, outdir, prefix, opts.single_pass, opts.balance, opts.journal, opts.progress)
+    except FileNotFoundError:
+        return gone_job(f, opts)
+    return finish_job(f, ok, t0, opts)
+
+def plan_one(f, base, outroot, limit, opts, sched):
+    # --part-tasks: plan here, then hand every part to the scheduler as its own task
+    rel=f.relative_to(base)
+    outdir=outroot/rel.parent
+    try:
+        reason=skip_reason(f, outdir, limit, opts)
+        if reason:
+            skip_job(f, reason, opts)
+            say(f"Skip ({reason}): {f}"); return
+        opts.progress.queue(f)
+        emit("job_started", file=str(f)); t0=time.monotonic()
+        plan=get_plan(f, limit, opts.balance, opts.journal)
+    except FileNotFoundError:
+        say(gone_job(f, opts)); return
+    if plan is None:
+        finish_job(f, False, t0, opts)
+        return
+    opts.progress.plan(f, plan)
+    sweep_temps(outdir, f.stem)
+    left={"n":len(plan), "ok":True}; lock=threading.Lock()
+    def run_part(*a):
+        ok=extract_part(*a)
+        with lock:
+            left["n"]-=1; left["ok"]=left["ok"] and ok
+            if left["n"]==0: return finish_job(f, left["ok"], t0, opts)
+    for i,pp in enumerate(plan,1):
+        sched.submit(pp.size, io_devices(f, outroot), run_part, f, pp, part_path(outdir, f.stem, i, f.suffix), limit, i, len(plan), opts.journal, opts.progress)
+
+# ---------- Scheduler ----------
+def io_devices(f, outroot):
+    # the filesystems a task reads from and writes to (st_dev: one per disk / mount)
+    return (("in", f.stat().st_dev), ("out", outroot.stat().st_dev))
+
+class LptScheduler:
+    """Worker threads that always start the largest pending task next (longest
+    processing time first), so one huge file never starts last and idles the others.
+    With device_jobs > 0, a task only starts while its input device has fewer than
+    device_jobs tasks running (out_device_jobs likewise for the output device); the
+    largest task that fits is picked instead."""
+    def __init__(self, jobs, device_jobs=0, out_device_jobs=0):
+        self.jobs=max(1,jobs)
+        self.caps={"in":device_jobs, "out":out_device_jobs}
+        self.cv=threading.Condition()
+        self.groups={}               # devices -> heap of pending tasks
+        self.busy=collections.Counter()
+        self.outstanding=0           # queued + running
+        self.running=0
+        self.closed=False
+        self.seq=itertools.count()
+
+    def submit(self, weight, devices, fn, *args):
+        with self.cv:
+            heapq.heappush(self.groups.setdefault(devices, []), (-weight, next(self.seq), fn, args))
+            self.outstanding+=1
+            self.cv.notify()
+
+    def _free(self, devices):
+        return all(self.caps[d[0]]<=0 or self.busy[d]<self.caps[d[0]] for d in devices)
+
+    def _take(self):
+        best=None
+        for devices,heap in self.groups.items():
+            if heap and self._free(devices) and (best is None or heap[0]<self.groups[best][0]):
+                best=devices
+        if best is None: return None, None
+        return best, heapq.heappop(self.groups[best])
+
+    def _worker(self):
+        while True:
+            with self.cv:
+                while True:
+                    if self.outstanding==0 and self.closed:
+                        self.cv.notify_all(); return
+                    devices,task=self._take()
+                    if task: break
+                    self.cv.wait()
+                for d in devices: self.busy[d]+=1
+                self.running+=1
+            _,_,fn,args=task
+            try:
+                msg=fn(*args)
+                if isinstance(msg, str): say(msg)
+            except Exception as e:
+                say(f"ERROR: {e}")
+            finally:
+                with self.cv:
+                    for d in devices: self.busy[d]-=1
+                    self.running-=1
+                    self.outstanding-=1
+                    self.cv.notify_all()
+
+    def start(self):
+        self.workers=[threading.Thread(target=self._worker, daemon=True) for _ in range(self.jobs)]
+        for w in self.workers: w.start()
+
+    def close(self):
+        # no more top-level submissions; workers exit once everything queued has run
+        with self.cv:
+            self.closed=True
+            self.cv.notify_all()
+
+    def join(self):
+        for w in self.workers: w.join()
+
+    def run(self):
+        self.close(); self.start(); self.join()
+
+# ---------- Watch mode ----------
+class InotifyWatcher:
+    """Linux inotify through ctypes: reports files closed after writing or moved in, and
+    adds watches for new subdirectories (whose existing videos are reported too)."""
+    kind="inotify"
+    IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE, IN_Q_OVERFLOW, IN_ISDIR = 0x8, 0x80, 0x100, 0x4000, 0x40000000
+
+    def __init__(self, base, recursive):
+        import ctypes, ctypes.util
+        self.libc=ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd=self.libc.inotify_init()
+        if self.fd<0: raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.base, self.recursive, self.wds = base, recursive, {}
+        self._add_tree(str(base))
+
+    def _add(self, d):
+        wd=self.libc.inotify_add_watch(self.fd, os.fsencode(d), self.IN_CLOSE_WRITE|self.IN_MOVED_TO|self.IN_CREATE)
+        if wd>=0: self.wds[wd]=d
+
+    def _add_tree(self, d):
+        self._add(d)
+        if not self.recursive: return []
+        found=[]
+        for e in os.scandir(d):
+            if e.is_dir(follow_symlinks=False): found+=self._add_tree(e.path)
+            elif is_video(Path(e.name)): found.append(Path(e.path))
+        return found
+
+    def changes(self, timeout):
+        if not select.select([self.fd],[],[],timeout)[0]: return []
+        buf=os.read(self.fd, 65536); out=[]; pos=0
+        while pos+16<=len(buf):
+            wd,mask,_,n=struct.unpack_from("iIII", buf, pos)
+            name=buf[pos+16:pos+16+n].split(b"\0",1)[0]; pos+=16+n
+            if mask & self.IN_Q_OVERFLOW:
+                out+=list(walk_videos(self.base, self.recursive)); continue
+            if wd not in self.wds or not name: continue
+            path=os.path.join(self.wds[wd], os.fsdecode(name))
+            if mask & self.IN_ISDIR:
+                if self.recursive and mask & (self.IN_CREATE|self.IN_MOVED_TO):
+                    try: out+=self._add_tree(path)
+                    except OSError: pass
+            elif mask & (self.IN_CLOSE_WRITE|self.IN_MOVED_TO|self.IN_CREATE):
+                out.append(Path(path))
+        return out
+
+class PollWatcher:
+    """Fallback: rewalk the folder every interval seconds and report new or changed videos."""
+    kind="polling"
+    def __init__(self, base, recursive, interval):
+        self.base, self.recursive, self.interval = base, recursive, interval
+        self.seen=self._snapshot(); self.next=time.monotonic()+interval
+
+    def _snapshot(self):
+        snap={}
+        for p in walk_videos(self.base, self.recursive):
+            try: st=p.stat()
+            except OSError: continue
+            snap[p]=(st.st_size, st.st_mtime_ns)
+        return snap
+
+    def changes(self, timeout):
+        time.sleep(max(0.0, min(timeout, self.next-time.monotonic())))
+        if time.monotonic()<self.next: return []
+        snap=self._snapshot(); self.next=time.monotonic()+self.interval
+        out=[p for p,sig in snap.items() if self.seen.get(p)!=sig]
+        self.seen=snap
+        return out
+
+def make_watcher(base, recursive, poll_interval):
+    if sys.platform.startswith("linux"):
+        try: return InotifyWatcher(base, recursive)
+        except (OSError, AttributeError): pass
+    return PollWatcher(base, recursive, poll_interval)
+
+def watch_folder(base, outroot, recursive, settle, poll_interval, on_ready, initial=()):
+    """Run until Ctrl+C: a reported video is handed to on_ready once its size and mtime
+    have not changed for settle seconds (the recorder has finished writing it). The
+    watcher is set up before initial (the startup walk) is read, so nothing arriving in
+    between is missed, and files already there go through the same settle check."""
+    watcher=make_watcher(base, recursive, poll_interval)
+    say(f"Watching {base} ({watcher.kind}, settle {settle:g}s). Ctrl+C to stop.")
+    queued={}
+    pending={p:None for p in initial if outroot not in p.parents}
+    while True:
+        for p in watcher.changes(1.0):
+            # never pick up our own parts when the output root lives inside the inbox
+            if is_video(p) and outroot not in p.parents: pending.setdefault(p, None)
+        now=time.monotonic()
+        for p in list(pending):
+            try: st=p.stat()
+            except OSError:
+                del pending[p]; continue
+            sig=(st.st_size, st.st_mtime_ns)
+            if pending[p] is None or pending[p][0]!=sig:
+                pending[p]=(sig, now); continue
+            if now-pending[p][1]>=settle and st.st_size>0:
+                del pending[p]
+                if queued.get(p)!=sig:
+                    queued[p]=sig; say(f"Queued: {p}"); on_ready(p)
+
+def run_batch(base, outroot, limit, args):
+    def run_serial(f):
+        say(f"Processing: {f}")
+        say(process_one(f, base, outroot, limit, args))
+
+    def queue(f):
+        args.progress.queue(f)
+        try: emit("job_queued", file=str(f), bytes=f.stat().st_size)
+        except OSError: pass
+
+    def submit(sched, f):
+        try: size=f.stat().st_size; devs=io_devices(f, outroot)
+        except OSError: return say(gone_job(f, args))
+        if args.part_tasks: sched.submit(size, devs, plan_one, f, base, outroot, limit, args, sched)
+        else: sched.submit(size, devs, process_one, f, base, outroot, limit, args)
+
+    serial=args.jobs<=1 and not args.part_tasks
+    if args.watch:
+        sched=LptScheduler(args.jobs, args.device_jobs, args.out_device_jobs); sched.start()
+        if metrics: metrics.sched=sched
+        def on_ready(f):
+            queue(f); submit(sched, f)
+        try: watch_folder(base, outroot, args.recursive, args.settle, args.poll_interval, on_ready,
+                          discover(base, args.recursive, {"entries":0}, args.index))
+        except KeyboardInterrupt: say("Stopping watch, finishing queued work...")
+        sched.close(); sched.join()
+    elif args.stream:
+        # start splitting while the walk is still running
+        say(f"Streaming discovery into workers. Output root: {outroot}")
+        stats={"entries":0}; t0=time.perf_counter(); found=0
+        sched=None if serial else LptScheduler(args.jobs, args.device_jobs, args.out_device_jobs)
+        if sched: sched.start()
+        if metrics: metrics.sched=sched
+        for f in discover(base, args.recursive, stats, args.index):
+            found+=1; queue(f)
+            if sched: submit(sched, f)
+            else: run_serial(f)
+        report_discovery(stats, found, t0)
+        if sched: sched.close(); sched.join()
+        if not found: say("Nothing new to split." if args.index else "No videos found."); return
+    else:
+        files=gather_files(base,args.recursive,args.index)
+        if not files:
+            say("Nothing new to split." if args.index else "No videos found."); return
+        # largest first: file size is the cost of a copy-mode split
+        sizes={}
+        for f in files:
+            try: sizes[f]=f.stat().st_size
+            except OSError: say(f"Skip (gone): {f}")
+        files=sorted(sizes, key=sizes.get, reverse=True)
+        say(f"Found {len(files)} video(s). Output root: {outroot}")
+        for f in files: queue(f)   # the batch ETA covers every file from the start
+        if serial:
+            for f in files: run_serial(f)
+        else:
+            sched=LptScheduler(args.jobs, args.device_jobs, args.out_device_jobs)
+            if metrics: metrics.sched=sched
+            for f in files: submit(sched, f)
+            sched.run()
+    say("All done.")
 
 def main():
     ap=argparse.ArgumentParser(description="Batch split videos by size with console animations.")
@@ -175,7 +945,22 @@ def main():
     ap.add_argument("--recursive",action="store_true")
     ap.add_argument("--skip-existing",action="store_true")
     ap.add_argument("--jobs",type=int,default=1,help="parallel workers")
-    ap.add_argument("--anim",default="auto",choices=["auto","random","spinner","snake","bounce","dots","earth","none"])
+    ap.add_argument("--watch",action="store_true",help="keep running and split new videos once they stop growing")
+    ap.add_argument("--settle",type=float,default=10.0,help="watch: seconds a file must stay unchanged before it is split")
+    ap.add_argument("--poll-interval",type=float,default=30.0,help="watch: rescan interval when inotify is unavailable")
+    ap.add_argument("--stream",action="store_true",help="hand files to workers while the folder walk is still running")
+    ap.add_argument("--device-jobs",type=int,default=0,help="max concurrent tasks per input disk/mount (0 = only --jobs applies)")
+    ap.add_argument("--out-device-jobs",type=int,default=0,help="max concurrent tasks writing to the output disk/mount (0 = no cap)")
+    ap.add_argument("--part-tasks",action="store_true",help="schedule each planned part as its own task across workers")
+    ap.add_argument("--single-pass",action="store_true",help="one ffmpeg per file (segment muxer) instead of one per part")
+    ap.add_argument("--balance",action="store_true",help="equal-sized parts instead of filling each to the limit")
+    ap.add_argument("--incremental",action="store_true",help="only rescan changed folders and only split new, modified or unfinished videos")
+    ap.add_argument("--resume",action="store_true",help="journal plans and finished parts under the output root; continue interrupted files")
+    ap.add_argument("--no-cache",action="store_true",help="do not use the probe cache under the output root")
+    ap.add_argument("--events",default=None,metavar="FILE",help="append JSON-lines events (jobs, parts, probes) to FILE")
+    ap.add_argument("--metrics",default=None,metavar="FILE",help="keep a Prometheus textfile (e.g. .../textfile/blobserk.prom) up to date")
+    ap.add_argument("--metrics-interval",type=float,default=15.0,help="seconds between --metrics rewrites")
+    ap.add_argument("--anim",default="auto",choices=["auto","random","spinner","snake","bounce","dots","earth","none"],help="frame style of the progress dashboard")
     args=ap.parse_args()
 
     require_bin("ffmpeg"); require_bin("ffprobe")
@@ -183,27 +968,28 @@ def main():
     base=Path(args.folder).expanduser().resolve()
     outroot=Path(args.outroot).expanduser().resolve()
     if not base.exists(): 
-        print("Input folder not found."); sys.exit(1)
+        say("Input folder not found."); sys.exit(1)
     limit=human_to_bytes(args.size_limit)
 
-    files=gather_files(base,args.recursive)
-    if not files:
-        print("No videos found."); return
-
-    print(f"Found {len(files)} video(s). Output root: {outroot}")
     outroot.mkdir(parents=True, exist_ok=True)
+    if not args.no_cache: open_probe_cache(outroot)
+    args.journal=Journal(outroot/Journal.FILENAME) if args.resume else None
+    args.index=ScanIndex(outroot/ScanIndex.FILENAME, limit, args.balance) if args.incremental else None
+    args.progress=Progress()
 
-    if args.jobs<=1:
-        for f in files:
-            print(f"Processing: {f}")
-            msg = process_one(f, base, outroot, limit, args.skip_existing, args.anim)
-            print(msg)
-    else:
-        with ThreadPoolExecutor(max_workers=args.jobs) as ex:
-            futures = {ex.submit(process_one,f,base,outroot,limit,args.skip_existing,args.anim): f for f in files}
-            for fut in as_completed(futures):
-                print(fut.result())
-    print("All done.")
+    global display, events, metrics
+    if args.events:
+        events=EventLog(Path(args.events).expanduser())
+        blobserk.add_cmd_hook(events.on_cmd)
+    if args.metrics:
+        metrics=Metrics(Path(args.metrics).expanduser(), args.metrics_interval)
+        blobserk.add_cmd_hook(metrics.on_cmd)
+        metrics.start()
+    display=Display(args.anim, footer=args.progress.batch); display.start()
+    try: run_batch(base, outroot, limit, args)
+    finally:
+        display.stop(); display=None
+        if metrics: metrics.stop()
 
 if __name__=="__main__":
     main()
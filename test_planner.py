@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from blobserk import PacketIndex, balanced_cut_indices, greedy_cut_indices, plan_cuts
+
+def make_index(gop_sizes, gop_seconds=2.0):
+    idx = PacketIndex()
+    cum = 0
+    for i, size in enumerate(gop_sizes):
+        idx.add_keyframe(i * gop_seconds, i * gop_seconds - 0.08, cum)
+        cum += size
+    idx.total_bytes = cum
+    idx.duration = len(gop_sizes) * gop_seconds
+    return idx
+
+def layouts(n=500, seed=1234):
+    rng = random.Random(seed)
+    for _ in range(n):
+        gops = [rng.randint(1, 100) for _ in range(rng.randint(1, 60))]
+        yield gops, rng.randint(max(gops), 2 * sum(gops))
+
+def part_sizes(offs, total, cuts):
+    bounds = [0] + [offs[j] for j in cuts] + [total]
+    return [b - a for a, b in zip(bounds, bounds[1:])]
+
+@pytest.mark.parametrize("balance", [False, True])
+def test_plan_tiles_input_on_keyframes(balance):
+    for gops, budget in layouts():
+        idx = make_index(gops)
+        plan = plan_cuts(idx, budget, idx.duration, margin=0.0, balance=balance)
+        assert plan[0].start == 0.0 and plan[-1].end == idx.duration
+        assert sum(pp.size for pp in plan) == idx.total_bytes
+        for a, b in zip(plan, plan[1:]):
+            assert a.end == b.start and b.start in idx.kf_times
+            assert a.stop == idx.kf_dts[list(idx.kf_times).index(b.start)]
+        # every GOP fits, so every part does
+        assert max(pp.size for pp in plan) <= budget
+
+def test_balanced_never_worse_than_greedy():
+    for gops, budget in layouts():
+        idx = make_index(gops)
+        offs, total = idx.kf_bytes, idx.total_bytes
+        greedy = greedy_cut_indices(offs, total, budget)
+        balanced = balanced_cut_indices(offs, total, budget)
+        assert len(balanced) <= len(greedy)
+        assert max(part_sizes(offs, total, balanced)) <= max(part_sizes(offs, total, greedy))
+
+def test_balanced_evens_out_tail():
+    idx = make_index([10] * 10)
+    sizes = [pp.size for pp in plan_cuts(idx, 90, idx.duration, margin=0.0, balance=True)]
+    assert sizes == [50, 50]
+
+def test_overhead_shrinks_budget():
+    idx = make_index([10] * 10)
+    assert len(plan_cuts(idx, 50, idx.duration, margin=0.0)) == 2
+    assert len(plan_cuts(idx, 50, idx.duration, margin=0.0, file_size=110)) == 3
+
+def test_no_keyframes_is_an_error():
+    with pytest.raises(RuntimeError):
+        plan_cuts(PacketIndex(), 100, 10.0)